@@ -0,0 +1,20 @@
+import contextlib
+import os
+import tempfile
+
+@contextlib.contextmanager
+def atomic_write(filename, mode='w'):
+    """
+    Opens a temporary file next to filename for writing, and renames it to
+    filename once the block completes, so that readers (or a rerun after a
+    crash) see the old file or the new one, never a truncated one. If the
+    block raises, the temporary file is removed and filename is untouched.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filename)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.replace(tmp, filename)
+    except BaseException:
+        os.remove(tmp)
+        raise
@@ -0,0 +1,59 @@
+import numpy as np
+
+class BufferedRandom(object):
+    """
+    Buffered Random class.
+
+    Seedable random number generator for annealing hot paths, with the
+    subset of the random module's interface that the annealers use. Uniforms
+    are drawn from a NumPy PCG64 generator a buffer at a time, so a draw is a
+    list pop instead of a call into the random module, and integers and
+    choices are derived from them.
+
+    Generators for parallel workers should come from spawn(), which gives
+    independent streams that are reproducible from the parent seed.
+    """
+
+    def __init__(self, seed=None, buffer_size=4096):
+        """
+        Input:
+            seed: int, or a numpy.random.SeedSequence, None for fresh entropy
+            buffer_size: number of uniforms drawn at once
+        """
+        if isinstance(seed, np.random.SeedSequence):
+            self.seed_sequence = seed
+        else:
+            self.seed_sequence = np.random.SeedSequence(seed)
+        self.generator = np.random.Generator(np.random.PCG64(self.seed_sequence))
+        self.buffer_size = buffer_size
+        self._uniforms = []
+
+    def spawn(self, n):
+        """Returns n generators with independent streams, e.g. one per worker."""
+        return [BufferedRandom(s, self.buffer_size) for s in self.seed_sequence.spawn(n)]
+
+    def random(self):
+        """Returns a float uniform on [0, 1)."""
+        if not self._uniforms:
+            self._uniforms = self.generator.random(self.buffer_size).tolist()
+        return self._uniforms.pop()
+
+    def uniform(self, a, b):
+        return a + (b - a) * self.random()
+
+    def randint(self, a, b):
+        """Returns an int uniform on [a, b], both included."""
+        return a + int(self.random() * (b - a + 1))
+
+    def choice(self, seq):
+        return seq[int(self.random() * len(seq))]
+
+    def shuffle(self, x):
+        """Shuffles the mutable sequence x in place (Fisher-Yates)."""
+        for i in range(len(x) - 1, 0, -1):
+            j = int(self.random() * (i + 1))
+            x[i], x[j] = x[j], x[i]
+
+    def integers(self, high, size):
+        """Returns an int array of the given size, uniform on [0, high)."""
+        return self.generator.integers(high, size=size)
@@ -1,4 +1,5 @@
 import random
+import numpy as np
 
 class ConstraintGenerator(object):
     """
@@ -31,6 +32,7 @@ class ConstraintGenerator(object):
         self.gen_type = generator_type
         # could change later to actual names if desired
         self.wizards = [str(i) for i in range(self.num_wizards)]
+        self.wizard_index = {w: i for i, w in enumerate(self.wizards)}
 
     def generate(self, k):
         """
@@ -86,7 +88,7 @@ class ConstraintGenerator(object):
                 len(selected_count_to_wizard_list[current_level]) - 1,
             )
             target = selected_count_to_wizard_list[current_level][selection_level_target_index]
-            target_index = self.wizards.index(target)
+            target_index = self.wizard_index[target]
             selected_count_to_wizard_list[current_level].pop(
                 selection_level_target_index
             )
@@ -114,6 +116,60 @@ class ConstraintGenerator(object):
 
         return constraints
 
+    def generate_chunks(self, k, chunk_size=2**16):
+        """
+        Streaming, vectorized version of the random generator, for very
+        large k. Yields the k constraints as int arrays of shape (m, 3),
+        where row (first, second, target) holds wizard indices, of about
+        chunk_size rows each.
+
+        Keeps the invariants of _generate_random: targets are drawn level by
+        level, i.e. each run of n constraints has every wizard as target
+        once, in random order; the two other wizards are distinct and drawn
+        uniformly from the larger side of the target, so the wizards in
+        their listed order satisfy every constraint. Random numbers come
+        from numpy.random.
+        """
+        n = self.num_wizards
+        if n < 4:
+            raise ValueError("This generator requires a value of N >= 4")
+        if k < n // 3:
+            # We can't generate k constraints that mention all magicians
+            print("We reached an invalid value for k given n.")
+            return
+        # the larger free side [low, low + size) of every target
+        targets = np.arange(n)
+        low = np.where(targets < n / 2, targets + 1, 0)
+        size = np.where(targets < n / 2, n - 1 - targets, targets)
+
+        levels_per_chunk = max(1, chunk_size // n)
+        remaining = k
+        while remaining > 0:
+            levels = min(levels_per_chunk, -(-remaining // n))
+            target = np.argsort(np.random.random_sample((levels, n)), axis=1).ravel()[:remaining]
+            # first uniform on the side, second uniform on the rest of it
+            first = np.random.randint(0, size[target])
+            second = (first + 1 + np.random.randint(0, size[target] - 1)) % size[target]
+            chunk = np.empty((len(target), 3), dtype=np.int64)
+            chunk[:, 0] = low[target] + first
+            chunk[:, 1] = low[target] + second
+            chunk[:, 2] = target
+            remaining -= len(chunk)
+            yield chunk
+
+    def write_constraints(self, f, k, chunk_size=2**16):
+        """
+        Streams k constraints from generate_chunks to the open text file f,
+        one "first second target" line of wizard names per constraint.
+        """
+        names = np.array(self.wizards)
+        for chunk in self.generate_chunks(k, chunk_size):
+            lines = names[chunk[:, 0]]
+            for column in (1, 2):
+                lines = np.char.add(np.char.add(lines, " "), names[chunk[:, column]])
+            f.write("\n".join(lines.tolist()))
+            f.write("\n")
+
     def _generate_single_side_neighbor(self, k):
         """
         Single sided neighbor generator. For each TARGET wizard, creates a
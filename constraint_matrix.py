@@ -0,0 +1,118 @@
+import numpy as np
+
+class ConstraintMatrix(object):
+    """
+    Constraint Matrix class.
+
+    Integer-encoded view of a problem instance, used to evaluate the
+    constraints with vectorized NumPy comparisons instead of per-constraint
+    lookups. Wizards are the dense ids 0..n-1 assigned by solver.read_input,
+    and constraints are stored as a (k, 3) int32 array of those ids, in the
+    same order as the constraint list.
+
+    Position arrays map a wizard id to its position in an ordering. All
+    evaluation methods accept either a single position array of shape (n,)
+    or a stack of candidate position arrays of shape (m, n).
+
+    For scoring moves, self.incidence[w] lists the constraints mentioning
+    wizard w, padded with a sentinel constraint (0, 0, 0) that is never
+    violated.
+    """
+
+    def __init__(self, num_wizards, constraints):
+        """
+        Input:
+            num_wizards: number of wizard ids
+            constraints: list of 3-sequences of wizard ids
+        """
+        self.num_wizards = num_wizards
+        self.constraints = np.array(constraints, dtype=np.int32).reshape(-1, 3)
+
+        sentinel = len(self.constraints)
+        self._padded_constraints = np.vstack(
+            [self.constraints, np.zeros((1, 3), dtype=np.int32)]
+        )
+        wiz_to_constraints = [[] for _ in range(num_wizards)]
+        for i, c in enumerate(self.constraints.tolist()):
+            for w in set(c):
+                wiz_to_constraints[w].append(i)
+        max_degree = max([len(l) for l in wiz_to_constraints] + [1])
+        self.incidence = np.full((num_wizards, max_degree), sentinel, dtype=np.int32)
+        for w, l in enumerate(wiz_to_constraints):
+            self.incidence[w, :len(l)] = l
+
+    def positions(self, ordering):
+        """
+        Returns the position array of an ordering (a sequence of wizard ids),
+        or of a stack of orderings of shape (m, n).
+        """
+        ordering = np.asarray(ordering, dtype=np.intp)
+        positions = np.empty(ordering.shape, dtype=np.int32)
+        np.put_along_axis(
+            positions, ordering,
+            np.broadcast_to(np.arange(ordering.shape[-1], dtype=np.int32), ordering.shape),
+            axis=-1,
+        )
+        return positions
+
+    def violated_mask(self, positions):
+        """
+        Returns a boolean mask of the violated constraints, of shape (k,) for
+        a single position array or (m, k) for a stack of them.
+        """
+        positions = self._as_positions(positions)
+        return self._is_violated(positions[..., self.constraints])
+
+    def count_violated(self, positions):
+        """
+        Returns the number of violated constraints, as an int for a single
+        position array or as an (m,) array for a stack of them.
+        """
+        counts = np.count_nonzero(self.violated_mask(positions), axis=-1)
+        if np.ndim(counts) == 0:
+            return int(counts)
+        return counts
+
+    def swap_deltas(self, positions, first, second):
+        """
+        Returns the change in the number of violated constraints for each
+        candidate swap of wizards first[i] and second[i], scored together
+        from the incidence of the swapped wizards without applying any of
+        them.
+        """
+        positions = self._as_positions(positions)
+        first = np.asarray(first).reshape(-1, 1, 1)
+        second = np.asarray(second).reshape(-1, 1, 1)
+        degree = self.incidence.shape[1]
+        ids = np.concatenate(
+            [self.incidence[first[:, 0, 0]], self.incidence[second[:, 0, 0]]],
+            axis=1,
+        )
+        wizards = self._padded_constraints[ids]
+        before = positions[wizards]
+        after = np.where(
+            wizards == first, positions[second],
+            np.where(wizards == second, positions[first], before),
+        )
+        changes = (
+            self._is_violated(after).astype(np.int32)
+            - self._is_violated(before)
+        )
+        # constraints mentioning both wizards are in both halves; count them once
+        changes[:, degree:][(wizards[:, degree:] == first).any(axis=-1)] = 0
+        return changes.sum(axis=1)
+
+    @staticmethod
+    def _as_positions(positions):
+        # positions may come in as unsigned ints, which would wrap below
+        return np.asarray(positions).astype(np.int32, copy=False)
+
+    @staticmethod
+    def _is_violated(positions):
+        """
+        Given the positions of the wizards of constraints in the last axis,
+        returns whether each constraint is violated.
+        """
+        a, b, c = positions[..., 0], positions[..., 1], positions[..., 2]
+        # c lies strictly between a and b iff it is on opposite sides of them
+        return (c - a) * (c - b) < 0
@@ -0,0 +1,156 @@
+import sys
+import time
+
+class _OutOfTime(Exception):
+    pass
+
+class BranchAndBoundSolver(object):
+    """
+    Branch and Bound Solver class.
+
+    Exact solver for the Magician Age Ordering problem, for instances given
+    as wizard ids 0..n-1 and constraints (a, b, c) meaning that c is not
+    between a and b.
+
+    Builds orderings left to right. A constraint is decided when its target
+    c is placed: it holds iff both or neither of a and b are already placed,
+    since the others will all come after c. Candidates that would violate a
+    constraint are therefore never placed, and a wizard whose constraint has
+    exactly one outer wizard placed is blocked until the other one is.
+
+    Propagation: a candidate whose placement blocks no wizard is placed
+    without branching on the others, since moving it to the front of the
+    remaining order of any solution keeps it a solution. Otherwise the
+    candidates that block the fewest wizards (net of those they release)
+    are tried first. Whether the rest of the ordering can be completed only
+    depends on which wizards are placed, not on their order, so every
+    placed set found to be a dead end is remembered and never expanded
+    again.
+    """
+
+    def __init__(self, num_wizards, constraints):
+        """
+        Input:
+            num_wizards: number of wizard ids
+            constraints: list of 3-sequences of wizard ids
+        """
+        self.num_wizards = num_wizards
+        # as_target[c] lists the (a, b) of the constraints on c, and
+        # as_outer[a] the (b, c) of the constraints where a is an outer wizard
+        self.as_target = [[] for _ in range(num_wizards)]
+        self.as_outer = [[] for _ in range(num_wizards)]
+        for a, b, c in constraints:
+            if c == a or c == b:
+                # c can't be strictly between itself and another wizard
+                continue
+            self.as_target[c].append((a, b))
+            self.as_outer[a].append((b, c))
+            self.as_outer[b].append((a, c))
+        self.nodes = 0
+        self.exhausted = False
+
+    def solve(self, time_limit=None):
+        """
+        Input:
+            time_limit: seconds after which the search is abandoned
+        Output:
+            ordering: a list of wizard ids satisfying every constraint, or
+                      None if there is none or the time limit was hit;
+                      self.exhausted tells the two apart
+        """
+        self.nodes = 0
+        self.dead_ends = set()
+        self.exhausted = False
+        self.deadline = None if time_limit is None else time.time() + time_limit
+        ordering = []
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, self.num_wizards + 100))
+        try:
+            found = self._extend(0, ordering)
+            self.exhausted = not found
+        except _OutOfTime:
+            found = False
+        finally:
+            sys.setrecursionlimit(limit)
+        return ordering if found else None
+
+    def _extend(self, placed, ordering):
+        if len(ordering) == self.num_wizards:
+            return True
+        if placed in self.dead_ends:
+            return False
+        self.nodes += 1
+        if self.deadline is not None and self.nodes % 1000 == 0 and time.time() > self.deadline:
+            raise _OutOfTime()
+        if self._has_precedence_cycle(placed):
+            self.dead_ends.add(placed)
+            return False
+
+        candidates = []
+        for w in range(self.num_wizards):
+            if placed >> w & 1 or not self._is_placeable(w, placed):
+                continue
+            blocks = self._blocks(w, placed)
+            if blocks[0] == 0:
+                # forced: placing w now can't hurt
+                candidates = [(blocks, w)]
+                break
+            candidates.append((blocks, w))
+        candidates.sort()
+
+        for _, w in candidates:
+            ordering.append(w)
+            if self._extend(placed | 1 << w, ordering):
+                return True
+            ordering.pop()
+        self.dead_ends.add(placed)
+        return False
+
+    def _is_placeable(self, w, placed):
+        """Placing w now keeps every constraint on w satisfied."""
+        for a, b in self.as_target[w]:
+            if (placed >> a & 1) != (placed >> b & 1):
+                return False
+        return True
+
+    def _has_precedence_cycle(self, placed):
+        """
+        A constraint (a, b, c) with a placed but b and c not forces b before
+        c. The placed set is a dead end if these precedences form a cycle.
+        """
+        successors = {}
+        in_degree = {}
+        for c in range(self.num_wizards):
+            if placed >> c & 1:
+                continue
+            for a, b in self.as_target[c]:
+                if placed >> a & 1 == placed >> b & 1:
+                    continue
+                before = b if placed >> a & 1 else a
+                successors.setdefault(before, []).append(c)
+                in_degree[c] = in_degree.get(c, 0) + 1
+        ready = [w for w in successors if w not in in_degree]
+        remaining = len(in_degree)
+        while ready:
+            for c in successors.get(ready.pop(), ()):
+                in_degree[c] -= 1
+                if in_degree[c] == 0:
+                    remaining -= 1
+                    ready.append(c)
+        return remaining > 0
+
+    def _blocks(self, w, placed):
+        """
+        Returns (new blocks, new blocks - releases): the number of unplaced
+        targets that placing w would block, and that number net of the
+        targets it would release.
+        """
+        blocked, released = 0, 0
+        for other, c in self.as_outer[w]:
+            if placed >> c & 1:
+                continue
+            if placed >> other & 1:
+                released += 1
+            else:
+                blocked += 1
+        return blocked, blocked - released
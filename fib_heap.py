@@ -6,7 +6,7 @@ import os
 
 #how to run:
 #python fib_heap.py -n num -file yy_x (see below)
-#-n: number of iterations, an integer
+#-n: number of annealer processes in the solver's portfolio, an integer
 #-file: 20_x, 35_x, or 50_x where x is the file number you want to test on
 
 """
@@ -20,12 +20,11 @@ def getopts(argv):
     return opts
 
 def run_commands(num, file_name):
-    output = []
-    for i in range(int(num)):
-        command = 'nohup python solver.py phase2_inputs/inputs' + file_name[:2] + '/input' + file_name + '.in outputs/test_out' + file_name + '_' + str(i) + '.txt &'
-        print('Calling: ' + command)
-        output.append(os.system('nohup python solver.py phase2_inputs/inputs' + file_name[:2] + '/input' + file_name + '.in outputs/test_out' + file_name + '_' + str(i) + '.txt &'))
-    #print(output)
+    # a single solver runs num annealers in parallel and stops them all as
+    # soon as one of them finds a solution
+    command = 'python solver.py phase2_inputs/inputs' + file_name[:2] + '/input' + file_name + '.in outputs/test_out' + file_name + '.txt --workers ' + str(num)
+    print('Calling: ' + command)
+    return os.system(command)
 
 if __name__ == '__main__':
     from sys import argv
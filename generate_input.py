@@ -1,34 +1,96 @@
-from input_generator import DifficultInputGenerator
+from __future__ import print_function
+import argparse
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import cpu_count
+
+import numpy as np
+
+from atomic_write import atomic_write
 from constraint_generator import ConstraintGenerator
-from solver import MagicianAgeOrderingSolver
+from instance_validator import validateInput
+
+"""
+Generates instances of every size in bulk, in a pool of worker processes.
+
+Constraints are valid by construction: ConstraintGenerator.generate_chunks
+draws the two other wizards of every constraint on the same side of its
+target, so the wizards' order is a solution. Each instance is checked with
+the instance validator's parser before being written.
+
+#how to run:
+#python generate_input.py -o generated_inputs --sizes 20 35 50 -m 10 -j 4
+"""
 
 RATIO = 2.4
 
-def generate_constraint(constraint_constructor):
-    valid = True
-    while True:
-        constraints = constraint_constructor.generate(int(RATIO * n + 1))
-        for constraint in constraints:
-            _constraint = [int(i) for i in constraint]
-            if (_constraint[0] < _constraint[2] < _constraint[1]) or (_constraint[1] < _constraint[2] < _constraint[0]):
-                valid = False
-            elif _constraint[0] == _constraint[2] or _constraint[0] == _constraint[1] or _constraint[1] == _constraint[2]:
-                valid = False
-        if valid:
-            break
-    return constraints
-
-def generate_input():
-    n_list = [20, 35, 50]
-    for n in n_list:
-        constraint_constructor = ConstraintGenerator(n,\
-            ConstraintGenerator.RANDOM)
-        constraints = generate_constraint(constraint_constructor)
-        with open("input" + str(n) + ".in", "a") as f:
-            ans = [" ".join(c) for c in constraints]
-            print(ans)
-            for a in ans:
-                f.write(a)
-                f.write('\n')
-
-generate_input()
+def format_instance(n, k, seed):
+    """
+    Returns the text of an instance with n wizards and k constraints, in
+    the format read by instance_validator: n, the wizards in a valid age
+    ordering, k, then one constraint per line.
+    """
+    np.random.seed(seed)
+    # names are shuffled so that the valid ordering is not 0..n-1
+    names = np.random.permutation(n).astype(str)
+    f = io.StringIO()
+    f.write("{0}\n{1}\n{2}\n".format(n, " ".join(names), k))
+    for chunk in ConstraintGenerator(n, ConstraintGenerator.RANDOM).generate_chunks(k):
+        for first, second, target in chunk.tolist():
+            f.write("{0} {1} {2}\n".format(names[first], names[second], names[target]))
+    return f.getvalue()
+
+def generate_instance(filename, n, k, seed):
+    """Generates, validates and atomically writes one instance."""
+    text = format_instance(n, k, seed)
+    message = validateInput(io.StringIO(text), n)
+    if message != "Success!":
+        raise ValueError("{0}: {1}".format(filename, message))
+    with atomic_write(filename) as f:
+        f.write(text)
+    return filename
+
+def generate_inputs(output_dir, sizes, count, jobs, seed=None, ratio=RATIO, num_constraints=None):
+    """
+    Generates count instances of each size into output_dir/inputs<n>/
+    input<n>_<i>.in, with num_constraints constraints, or ratio * n + 1.
+    Instance i of size n is seeded from (seed, n, i). Returns the file names.
+    """
+    seeds = np.random.SeedSequence(seed)
+    filenames = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = []
+        for n in sizes:
+            k = num_constraints or int(ratio * n + 1)
+            directory = os.path.join(output_dir, "inputs" + str(n))
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            for i in range(count):
+                filename = os.path.join(directory, "input{0}_{1}.in".format(n, i))
+                instance_seed = int(np.random.SeedSequence(
+                    seeds.entropy, spawn_key=(n, i)).generate_state(1)[0])
+                futures.append(executor.submit(generate_instance, filename, n, k, instance_seed))
+        for future in futures:
+            filenames.append(future.result())
+            print("Wrote " + filenames[-1])
+    return filenames
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Bulk Instance Generator.")
+    parser.add_argument("-o", "--output-dir", type=str, default='generated_inputs')
+    parser.add_argument("--sizes", type=int, nargs='+', default=[20, 35, 50],
+                        help = "numbers of wizards")
+    parser.add_argument("-m", "--count", type=int, default=1,
+                        help = "number of instances of each size")
+    parser.add_argument("-j", "--jobs", type=int, default=cpu_count(),
+                        help = "number of instances generated in parallel")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--ratio", type=float, default=RATIO,
+                        help = "constraints per wizard")
+    parser.add_argument("-k", "--constraints", type=int, default=None,
+                        help = "number of constraints, overrides --ratio")
+    args = parser.parse_args()
+
+    generate_inputs(args.output_dir, args.sizes, args.count, args.jobs, args.seed,
+                    args.ratio, args.constraints)
@@ -1,10 +1,107 @@
-import time
+import argparse
+import json
 import logging
-from datetime import datetime
+import multiprocessing
+import os
+import random
+import re
 import matplotlib.pyplot as plt
 import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from atomic_write import atomic_write
+from result_store import ResultStore
 
 logging.basicConfig(format='%(asctime)s %(message)s', level=logging.DEBUG)
+# matplotlib logs every font lookup at the DEBUG level
+logging.getLogger('matplotlib').setLevel(logging.WARNING)
+
+# per worker process state of a sweep, set once by the pool initializer
+_worker_generate_constraint = None
+_worker_solve_problem = None
+
+def _init_experiment_worker(generate_constraint, solve_problem):
+    global _worker_generate_constraint, _worker_solve_problem
+    _worker_generate_constraint = generate_constraint
+    _worker_solve_problem = solve_problem
+
+def _run_experiment(task):
+    """
+    Runs repetition rep of the experiment for k constraints, seeding the
+    random generators from (seed, k, rep) so that a run is reproducible
+    whichever worker it lands on. Returns (k, rep, first_tictoc,
+    solution_count), with None results if no valid constraints exist for k.
+    """
+    k, rep, seed = task
+    random.seed("{0}-{1}-{2}".format(seed, k, rep))
+    np.random.seed(random.getrandbits(32))
+    constraints = _worker_generate_constraint(k)
+    if not constraints:
+        return k, rep, None, None
+    first_tictoc, solution_count = _worker_solve_problem(constraints)
+    return k, rep, first_tictoc, solution_count
+
+class ExperimentStats(object):
+    """
+    Running average, max and min of the time to first solution and of the
+    solution count over the repetitions of an experiment, and the sums of
+    squared deviations from the averages (Welford's method) giving their
+    confidence intervals.
+    """
+
+    FIELDS = ("reps", "valid", "avg_first_tictoc", "avg_solution_count",
+              "max_first_tictoc", "max_solution_count",
+              "min_first_tictoc", "min_solution_count",
+              "m2_first_tictoc", "m2_solution_count")
+
+    """z score of a two-sided 95% confidence interval"""
+    Z_95 = 1.96
+
+    def __init__(self):
+        self.reps = 0
+        self.valid = True
+        self.avg_first_tictoc, self.avg_solution_count = 0, 0
+        self.max_first_tictoc, self.max_solution_count = 0, 0
+        self.min_first_tictoc, self.min_solution_count = float("inf"), float("inf")
+        self.m2_first_tictoc, self.m2_solution_count = 0, 0
+
+    def add(self, first_tictoc, solution_count):
+        self.reps += 1
+        delta = first_tictoc - self.avg_first_tictoc
+        self.avg_first_tictoc += delta / self.reps
+        self.m2_first_tictoc += delta * (first_tictoc - self.avg_first_tictoc)
+        delta = solution_count - self.avg_solution_count
+        self.avg_solution_count += delta / self.reps
+        self.m2_solution_count += delta * (solution_count - self.avg_solution_count)
+        self.max_first_tictoc = max(self.max_first_tictoc, first_tictoc)
+        self.max_solution_count = max(self.max_solution_count, solution_count)
+        self.min_first_tictoc = min(self.min_first_tictoc, first_tictoc)
+        self.min_solution_count = min(self.min_solution_count, solution_count)
+
+    def has_converged(self, tolerance):
+        """
+        Whether the 95% confidence intervals of both averages are within
+        tolerance times the average on each side.
+        """
+        if self.reps < 2:
+            return False
+        for avg, m2 in ((self.avg_first_tictoc, self.m2_first_tictoc),
+                        (self.avg_solution_count, self.m2_solution_count)):
+            half_width = self.Z_95 * (m2 / (self.reps - 1) / self.reps) ** 0.5
+            if half_width > tolerance * abs(avg):
+                return False
+        return True
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, d):
+        stats = cls()
+        for field in cls.FIELDS:
+            setattr(stats, field, d.get(field, 0))
+        return stats
 
 class DifficultInputGenerator:
     """
@@ -18,18 +115,35 @@ class DifficultInputGenerator:
 
     MAX_NUM_CONSTRAINTS = 500
 
-    def __init__(self, generate_constraint, solve_problem, max_constraints = 500):
+    def __init__(self, generate_constraint, solve_problem, max_constraints = 500,
+                 generator_type = -1, results_file = 'saved_results.bin',
+                 figures_dir = None):
         """
         Constructs the Input Generator object given a constraint generation
         function (which returns a set of constraints given a number of magicians
         and a number of constraints) and a problem solver (which returns a valid
         ordering, time until first solution, and number of total solutions).
+
+        Every experiment is recorded in the ResultStore results_file (None
+        not to record them) under generator_type, the ConstraintGenerator
+        type of generate_constraint.
+
+        If figures_dir is given, figures are not shown as they are plotted
+        but collected, and written to image files in figures_dir at the end
+        of a sweep, without an interactive backend.
         """
         self.generate_constraint = generate_constraint
         self.solve_problem = solve_problem
         self.max_num_constraints = min(self.MAX_NUM_CONSTRAINTS, max_constraints)
+        self.generator_type = generator_type
+        self.store = ResultStore(results_file) if results_file else None
+        self.figures_dir = figures_dir
+        self.figures = []
 
-    def find_best_constraint_to_magicians_ratio(self, n, start_k = 1, reps = 1000):
+    def find_best_constraint_to_magicians_ratio(self, n, start_k = 1, reps = 1000,
+                                                processes = 1, seed = None,
+                                                checkpoint = None, tolerance = None,
+                                                min_reps = 30, coarse_step = None):
         """
         This routine will find the number of constraints k that makes a problem
         of size n take the most time while having the least number of possible
@@ -47,6 +161,17 @@ class DifficultInputGenerator:
         Input:
             n: number of magicians in the input problem
             reps: number of experiments ran for each number of constraints k
+            processes: number of worker processes running the experiments
+            seed: seed of the experiments, drawn at random if None
+            checkpoint: file in which the results of each finished k are
+                        saved, and from which a rerun resumes
+            tolerance: if given, stop the experiments for a k once the 95%
+                       confidence intervals of its averages are within
+                       tolerance times the averages, after at least
+                       min_reps and at most reps experiments
+            coarse_step: if given, search k coarse to fine from every
+                         coarse_step-th k (see search_k) instead of trying
+                         every k
 
         Output:
             ratio: the best number of constraint k divided by the number of
@@ -57,56 +182,202 @@ class DifficultInputGenerator:
 
         # 1. Perform experiments
         logging.debug("Experiment: n = {0}, starting k = {1}".format(n, start_k))
-        avg_first_tictoc_list, avg_solution_count_list = [], []
-        max_first_tictoc_list, max_solution_count_list = [], []
-        min_first_tictoc_list, min_solution_count_list = [], []
-        k_list = list(range(start_k, self.max_num_constraints + 1))
-        for k in k_list:
-            logging.debug("Trying k = {0}".format(k))
-            avg_first_tictoc, avg_solution_count = 0, 0
-            max_first_tictoc, max_solution_count = 0, 0
-            min_first_tictoc, min_solution_count = float("inf"), float("inf")
-            for _ in range(reps):
-                print("Iteration {0}/{1}".format(_ + 1, reps), end='\r')
-                constraints = self.generate_constraint(k)
-                if not constraints:
-                    # We should only reach here if k is a number such that no
-                    # valid input problem of size n and k constraints can be
-                    # generated.
-                    logging.warning("There are no valid constraints for k = {0}"\
-                        .format(k))
-                    break
-                first_tictoc, solution_count = self.solve_problem(constraints)
-                avg_first_tictoc += first_tictoc
-                avg_solution_count += solution_count
-                max_first_tictoc = max(max_first_tictoc, first_tictoc)
-                max_solution_count = max(max_solution_count, solution_count)
-                min_first_tictoc = min(min_first_tictoc, first_tictoc)
-                min_solution_count = min(min_solution_count, solution_count)
-            avg_first_tictoc /= reps
-            avg_solution_count /= reps
-            avg_first_tictoc_list.append(avg_first_tictoc)
-            avg_solution_count_list.append(avg_solution_count)
-            max_first_tictoc_list.append(max_first_tictoc)
-            max_solution_count_list.append(max_solution_count)
-            min_first_tictoc_list.append(min_first_tictoc)
-            min_solution_count_list.append(min_solution_count)
+        if coarse_step is None:
+            k_list = list(range(start_k, self.max_num_constraints + 1))
+            results = self.run_sweep(n, k_list, reps, processes, seed, checkpoint,
+                                     tolerance, min_reps)
+        else:
+            results = self.search_k(n, start_k, self.max_num_constraints, reps, processes,
+                                    seed, checkpoint, tolerance, min_reps, coarse_step)
+            k_list = sorted(k for k in results if start_k <= k <= self.max_num_constraints)
+        avg_first_tictoc_list = [results[k].avg_first_tictoc for k in k_list]
+        avg_solution_count_list = [results[k].avg_solution_count for k in k_list]
+        max_first_tictoc_list = [results[k].max_first_tictoc for k in k_list]
+        max_solution_count_list = [results[k].max_solution_count for k in k_list]
+        min_first_tictoc_list = [results[k].min_first_tictoc for k in k_list]
+        min_solution_count_list = [results[k].min_solution_count for k in k_list]
 
         # 2. Save experiments
-        logging.debug("Saving results...")
-        result_logs = {
-            "MagicianNumber": n,
-            "AverageFirstTictocList": avg_first_tictoc_list,
-            "AverageSolutionCountList": avg_solution_count_list,
-            "MaxFirstTictocList": max_first_tictoc_list,
-            "MaxSolutionCountList": max_solution_count_list,
-            "MinFirstTictocList": min_first_tictoc_list,
-            "MinSolutionCountList": min_solution_count_list
-        }
-        self.save_results(result_logs)
-        logging.debug("Results saved!")
+        # (each experiment was recorded in self.store as its k finished)
+        if self.store is not None:
+            logging.debug("Results saved in {0}".format(self.store.filename))
 
         # 3. Plot results
+        scaled_avg_first_tictoc_list = [i/j for i, j in \
+            zip(avg_first_tictoc_list, k_list)]
+        if not any(scaled_avg_first_tictoc_list):
+            # e.g. a SolutionCounter, which only counts the solutions
+            logging.warning("solve_problem reported no time to first solution, "
+                            "the 'scaled time' results are meaningless")
+        self.plot_results(n, k_list, avg_first_tictoc_list, avg_solution_count_list,
+            max_first_tictoc_list, max_solution_count_list,
+            min_first_tictoc_list, min_solution_count_list)
+        if self.figures_dir is not None:
+            self.render_figures()
+
+        # 4. Analyze and return final result
+        # (k_list may skip values of k, so positions are mapped back to k)
+        best_i_1 = np.argmin(avg_solution_count_list)
+        best_k_1 = k_list[best_i_1]
+        print("Best k based on 'solution count' figure: {0} ({1})" \
+            .format(best_k_1, min(avg_solution_count_list)))
+        best_k_2 = k_list[np.argmax(scaled_avg_first_tictoc_list)]
+        print("Best k based on 'scaled time' figure: {0} ({1})" \
+            .format(best_k_2, max(scaled_avg_first_tictoc_list)))
+        best_k_next_10 = scaled_avg_first_tictoc_list[best_i_1:best_i_1+11]
+        print("Solution count for the next 10 best k based on 'scaled time': {0}" \
+            .format(best_k_next_10))
+        print("Ratio for the min among these next 10 best k: {0}" \
+            .format(k_list[np.argmin(best_k_next_10) + best_i_1] / n))
+
+        avg_best_k = best_k_1 + best_k_2 // 2 # not necessarily true, but...
+        final_ratio = avg_best_k / n
+        return final_ratio
+
+    def run_sweep(self, n, k_list, reps, processes = 1, seed = None, checkpoint = None,
+                  tolerance = None, min_reps = 30):
+        """
+        Runs reps experiments for every k of k_list, spread over a pool of
+        processes, and returns a dict from k to its ExperimentStats. The
+        experiments of every k are recorded in the result store as soon as
+        they are all done.
+
+        With a tolerance, experiments are run in rounds of min_reps and a k
+        is done as soon as its confidence intervals are within tolerance
+        (see ExperimentStats.has_converged), reps being only the maximum.
+
+        Every finished k is saved to the checkpoint file, if any. A rerun
+        with the same n, reps and tolerance (and seed, or no seed) only runs
+        the k not saved yet.
+        """
+        seed, results = self.load_checkpoint(checkpoint, n, reps, tolerance, seed)
+        todo = [k for k in k_list if k not in results]
+        if len(todo) < len(k_list):
+            logging.debug("{0} k done already, {1} k left".format(len(k_list) - len(todo), len(todo)))
+        running = {k: ExperimentStats() for k in todo}
+        rows = {k: [] for k in todo}
+        round_reps = reps if tolerance is None else min(min_reps, reps)
+
+        if processes > 1:
+            pool = multiprocessing.Pool(processes, initializer=_init_experiment_worker,
+                                        initargs=(self.generate_constraint, self.solve_problem))
+        else:
+            pool = None
+            _init_experiment_worker(self.generate_constraint, self.solve_problem)
+        try:
+            while running:
+                # the experiments of this round end at rep targets[k]
+                targets = {k: min(len(rows[k]) + round_reps, reps) for k in running}
+                tasks = [(k, rep, seed) for k in running
+                         for rep in range(len(rows[k]), targets[k])]
+                if pool is not None:
+                    experiments = pool.imap_unordered(_run_experiment, tasks,
+                                                      chunksize=max(1, round_reps // 20))
+                else:
+                    experiments = map(_run_experiment, tasks)
+                for k, rep, first_tictoc, solution_count in experiments:
+                    rows[k].append((n, k, self.generator_type, seed, rep,
+                                    first_tictoc, solution_count))
+                    if first_tictoc is None:
+                        # We should only reach here if k is a number such that no
+                        # valid input problem of size n and k constraints can be
+                        # generated.
+                        running[k].valid = False
+                    elif running[k].valid:
+                        running[k].add(first_tictoc, solution_count)
+
+                    # a k is saved as soon as its round is done, so that an
+                    # interrupted sweep keeps every k finished so far
+                    if len(rows[k]) < targets[k]:
+                        continue
+                    if running[k].valid and len(rows[k]) < reps and \
+                            not (tolerance is not None and running[k].has_converged(tolerance)):
+                        continue
+                    if not running[k].valid:
+                        logging.warning("There are no valid constraints for k = {0}"\
+                            .format(k))
+                        running[k] = ExperimentStats()
+                        running[k].valid = False
+                    results[k] = running.pop(k)
+                    logging.debug("Finished k = {0} after {1} reps".format(k, len(rows[k])))
+                    if self.store is not None:
+                        self.store.append(rows.pop(k))
+                    self.save_checkpoint(checkpoint, n, reps, tolerance, seed, results)
+        finally:
+            if pool is not None:
+                pool.terminate()
+        return results
+
+    def search_k(self, n, k_min, k_max, reps, processes = 1, seed = None, checkpoint = None,
+                 tolerance = None, min_reps = 30, coarse_step = 16):
+        """
+        Searches for the k with the lowest average solution count and the k
+        with the highest average time to first solution per constraint,
+        coarse to fine: runs a sweep over every coarse_step-th k of
+        [k_min, k_max], then over every k a quarter as far apart around
+        each best k, bracketed by its neighbours, until neighbouring k are
+        swept. Returns a dict from each k swept to its ExperimentStats.
+        """
+        seed, results = self.load_checkpoint(checkpoint, n, reps, tolerance, seed)
+        step = max(1, coarse_step)
+        k_list = list(range(k_min, k_max + 1, step))
+        if k_list[-1] != k_max:
+            k_list.append(k_max)
+        while True:
+            # the k bracketing each best k were swept already
+            k_list = [k for k in k_list if k not in results]
+            results.update(self.run_sweep(n, k_list, reps, processes, seed, checkpoint,
+                                          tolerance, min_reps))
+            if step == 1:
+                return results
+            swept = sorted(k for k in results if k_min <= k <= k_max and results[k].valid)
+            if not swept:
+                return results
+            best = [
+                min(range(len(swept)), key=lambda i: results[swept[i]].avg_solution_count),
+                max(range(len(swept)), key=lambda i: results[swept[i]].avg_first_tictoc / swept[i]),
+            ]
+            step = max(1, step // 4)
+            k_list = sorted(set(
+                k for i in best
+                for k in range(swept[max(i - 1, 0)], swept[min(i + 1, len(swept) - 1)] + 1, step)
+            ))
+
+    def load_checkpoint(self, filename, n, reps, tolerance, seed):
+        """
+        Returns the seed and the results saved in a checkpoint file by a
+        sweep with the same parameters, or the seed (drawn at random if
+        None) and no results.
+        """
+        if filename is not None and os.path.exists(filename):
+            with open(filename) as f:
+                saved = json.load(f)
+            if (saved["n"], saved["reps"], saved.get("tolerance")) == (n, reps, tolerance) \
+                    and seed in (None, saved["seed"]):
+                return saved["seed"], {int(k): ExperimentStats.from_dict(d)
+                                       for k, d in saved["results"].items()}
+            logging.warning("Ignoring checkpoint {0} of another sweep".format(filename))
+        if seed is None:
+            seed = random.getrandbits(32)
+        return seed, {}
+
+    def save_checkpoint(self, filename, n, reps, tolerance, seed, results):
+        if filename is None:
+            return
+        saved = {
+            "n": n, "reps": reps, "tolerance": tolerance, "seed": seed,
+            "results": {k: stats.to_dict() for k, stats in results.items()},
+        }
+        # write then rename, so that an interrupted save keeps the last one
+        with atomic_write(filename) as f:
+            json.dump(saved, f)
+
+    def plot_results(self, n, k_list, avg_first_tictoc_list, avg_solution_count_list,
+                     max_first_tictoc_list, max_solution_count_list,
+                     min_first_tictoc_list, min_solution_count_list):
+        """
+        Plots the results of a sweep over k for n magicians.
+        """
         logging.debug("Plotting results...")
 
         # Average plotting
@@ -133,36 +404,52 @@ class DifficultInputGenerator:
             k_list, min_first_tictoc_list, "k", "Min Time to 1st Solution", "orange")
         logging.debug("Done plotting.")
 
-        # 4. Analyze and return final result
-        best_k_1 = np.argmin(avg_solution_count_list) + 1
-        print("Best k based on 'solution count' figure: {0} ({1})" \
-            .format(best_k_1, min(avg_solution_count_list)))
-        best_k_2 = np.argmax(scaled_avg_first_tictoc_list) + 1
-        print("Best k based on 'scaled time' figure: {0} ({1})" \
-            .format(best_k_2, max(scaled_avg_first_tictoc_list)))
-        best_k_next_10 = scaled_avg_first_tictoc_list[best_k_1-1:best_k_1+10]
-        print("Solution count for the next 10 best k based on 'scaled time': {0}" \
-            .format(best_k_next_10))
-        print("Ratio for the min among these next 10 best k: {0}" \
-            .format((np.argmin(best_k_next_10) + best_k_1) / n))
-
-        avg_best_k = best_k_1 + best_k_2 // 2 # not necessarily true, but...
-        final_ratio = avg_best_k / n
-        return final_ratio
+    def plot_stored_results(self, n, generator_type = None, seed = None):
+        """
+        Plots the results recorded in the result store for n magicians
+        (of one generator and one sweep if given), without running any
+        experiment.
+        """
+        aggregated = self.store.aggregate(n, generator_type, seed)
+        if not len(aggregated['k']):
+            logging.warning("No results stored for n = {0}".format(n))
+        self.plot_results(n, aggregated['k'].tolist(),
+            aggregated['avg_first_tictoc'].tolist(), aggregated['avg_solution_count'].tolist(),
+            aggregated['max_first_tictoc'].tolist(), aggregated['max_solution_count'].tolist(),
+            aggregated['min_first_tictoc'].tolist(), aggregated['min_solution_count'].tolist())
 
-    def save_results(self, results, filename = 'saved_results.txt'):
+    def render_figures(self, figures_dir = None):
         """
-        Save results from an experiment in a file.
+        Writes every collected figure to a PNG file named after its title,
+        in one pass, and returns the file names.
         """
-        with open(filename, "a") as f:
-            ts = time.time()
-            timestamp = datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
-            f.write("{0} --- {1}\n\n\n".format(timestamp, results))
+        figures_dir = figures_dir or self.figures_dir
+        if not os.path.isdir(figures_dir):
+            os.makedirs(figures_dir)
+        filenames = []
+        for title, x, y, xlabel, ylabel, color in self.figures:
+            figure = Figure()
+            FigureCanvasAgg(figure)
+            axes = figure.add_subplot(1, 1, 1)
+            axes.plot(x, y, color=color)
+            axes.set_title(title)
+            axes.set_xlabel(xlabel)
+            axes.set_ylabel(ylabel)
+            name = re.sub(r'[^a-z0-9]+', '_', title.lower()).strip('_')
+            filenames.append(os.path.join(figures_dir, name + '.png'))
+            figure.savefig(filenames[-1])
+        self.figures = []
+        logging.debug("Wrote {0} figures to {1}".format(len(filenames), figures_dir))
+        return filenames
 
     def show_plot(self, title, x, y, xlabel, ylabel, color='g'):
         """
-        Plot x vs y.
+        Plot x vs y, or collect the plot for render_figures if figures are
+        written to files.
         """
+        if self.figures_dir is not None:
+            self.figures.append((title, list(x), list(y), xlabel, ylabel, color))
+            return
         plt.plot(x, y)
         plt.title(title)
         plt.xlabel(xlabel)
@@ -171,3 +458,21 @@ class DifficultInputGenerator:
 
     def find_solution_number_variation_for_each_constraint_number(self):
         pass
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description = "Regenerates the figures of stored experiment results.")
+    parser.add_argument("results_file", type=str, help = "result store of the experiments")
+    parser.add_argument("n", type=int, help = "number of magicians")
+    parser.add_argument("figures_dir", type=str, help = "directory to write the figures to")
+    parser.add_argument("--generator", type=int, default=None,
+                        help = "only plot the experiments of this ConstraintGenerator type")
+    parser.add_argument("--seed", type=int, default=None,
+                        help = "only plot the experiments of the sweep with this seed")
+    args = parser.parse_args()
+
+    input_generator = DifficultInputGenerator(None, None, results_file=args.results_file,
+                                              figures_dir=args.figures_dir)
+    input_generator.plot_stored_results(args.n, args.generator, args.seed)
+    for filename in input_generator.render_figures():
+        print(filename)
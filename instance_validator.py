@@ -11,7 +11,11 @@ def main(argv):
     print(processInput(argv[0], int(argv[1])))
 
 def processInput(s, max_nodes):
-    fin = open(s, "r")
+    with open(s, "r") as fin:
+        return validateInput(fin, max_nodes)
+
+def validateInput(fin, max_nodes):
+    """Validates an instance read from fin, an open text file or io.StringIO."""
     line1 = fin.readline().split()
     # Ensures that the first line contains an integer.
     if len(line1) != 1 or not line1[0].isdigit():
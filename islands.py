@@ -0,0 +1,134 @@
+from __future__ import division
+from __future__ import print_function
+import multiprocessing
+import os
+import random
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from wizards import worker_annealer
+
+def _island_worker(island, num_islands, shm_name, lock, solved, num_wizards, num_constraints,
+                   wizards, constraints, seed, Tmax, Tmin, chunks_per_cycle,
+                   migration_interval, adopt_rate):
+    """
+    Runs one island in its own process: anneals in chunks of
+    migration_interval steps along a repeating geometric cooling schedule,
+    publishing its ordering into its slot of the shared board after every
+    chunk and adopting the best published ordering when it is better.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    board = np.ndarray((num_islands, len(wizards) + 1), dtype=np.int32, buffer=shm.buf)
+    try:
+        annealer = worker_annealer(seed, num_wizards, num_constraints, wizards, constraints)
+        chunk = 0
+        while not solved.is_set():
+            T = Tmax * (Tmin / Tmax) ** ((chunk % chunks_per_cycle) / chunks_per_cycle)
+            E, _, _ = annealer.run_at(T, migration_interval)
+            chunk += 1
+            if annealer.solution is not None:
+                E = 0
+                annealer.set_state(annealer.solution)
+
+            with lock:
+                if E < board[island, 0]:
+                    board[island, 0] = E
+                    board[island, 1:] = annealer.state
+                if E == 0:
+                    solved.set()
+                    break
+                best = int(np.argmin(board[:, 0]))
+                best_energy = int(board[best, 0])
+                best_state = board[best, 1:].tolist()
+            if best_energy < E and random.random() < adopt_rate:
+                annealer.set_state(best_state)
+    finally:
+        del board
+        shm.close()
+
+class IslandModel(object):
+    """
+    Island Model annealing for NonBetweenness.
+
+    Runs independent NonBetweenness annealers ("islands") in separate
+    processes. At every migration interval each island publishes its
+    ordering, as an int array, into its own row of a shared memory board,
+    and adopts an exact copy of the best ordering published by any island
+    (with probability adopt_rate) if it beats its own. Exchanging plain
+    int arrays through shared memory keeps migration cheap, so islands can
+    share what they learn instead of restarting from scratch.
+    """
+
+    def __init__(self, num_wizards, num_constraints, wizards, constraints,
+                 num_islands=None, Tmin=0.08, Tmax=2.0, migration_interval=2000,
+                 chunks_per_cycle=50, adopt_rate=0.5):
+        """
+        Input:
+            num_islands: number of islands and worker processes, defaults
+                         to the number of cores
+            Tmin, Tmax: temperature range of each island's cooling cycle
+            migration_interval: annealing steps between two migrations
+            chunks_per_cycle: migrations per cooling cycle, after which an
+                              island reheats to Tmax
+            adopt_rate: probability that an island adopts a better ordering
+        """
+        self.num_wizards = num_wizards
+        self.num_constraints = num_constraints
+        self.wizards = list(wizards)
+        self.constraints = constraints
+        self.num_islands = num_islands or os.cpu_count() or 1
+        self.Tmin = Tmin
+        self.Tmax = Tmax
+        self.migration_interval = migration_interval
+        self.chunks_per_cycle = chunks_per_cycle
+        self.adopt_rate = adopt_rate
+
+    def run(self, time_limit=None, seed=None):
+        """
+        Runs the islands until one of them reaches zero energy, or until
+        time_limit seconds have passed.
+
+        Output:
+            (state, energy): the best published ordering and its energy
+        """
+        rng = random.Random(seed)
+        n = len(self.wizards)
+        # one row per island: [energy, ordering...]
+        unpublished = np.iinfo(np.int32).max
+        shm = shared_memory.SharedMemory(create=True, size=self.num_islands * (n + 1) * 4)
+        board = np.ndarray((self.num_islands, n + 1), dtype=np.int32, buffer=shm.buf)
+        board[:, 0] = unpublished
+        board[:, 1:] = self.wizards
+        lock = multiprocessing.Lock()
+        solved = multiprocessing.Event()
+        workers = []
+        try:
+            for island in range(self.num_islands):
+                worker = multiprocessing.Process(
+                    target=_island_worker,
+                    args=(island, self.num_islands, shm.name, lock, solved, self.num_wizards,
+                          self.num_constraints, self.wizards, self.constraints,
+                          rng.getrandbits(64), self.Tmax, self.Tmin,
+                          self.chunks_per_cycle, self.migration_interval,
+                          self.adopt_rate),
+                )
+                worker.daemon = True
+                worker.start()
+                workers.append(worker)
+            solved.wait(time_limit)
+            solved.set()
+            for worker in workers:
+                worker.join(1)
+                if worker.is_alive():
+                    worker.terminate()
+            best = int(np.argmin(board[:, 0]))
+            best_energy = int(board[best, 0])
+            best_state = board[best, 1:].tolist()
+            if best_energy == unpublished:
+                best_energy = float("inf")
+        finally:
+            del board
+            shm.close()
+            shm.unlink()
+        return best_state, best_energy
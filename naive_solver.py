@@ -2,6 +2,31 @@ import time
 from datetime import datetime
 from random import shuffle
 import itertools
+import multiprocessing
+
+# per worker process state of a sharded solve, set once by the pool initializer
+_worker_solver = None
+_worker_constraints = None
+
+def _init_shard_worker(n, constraints):
+    global _worker_solver, _worker_constraints
+    _worker_solver = MagicianAgeOrderingSolver(n)
+    _worker_constraints = constraints
+
+def _solve_shard(prefix):
+    """
+    Counts the valid orderings starting with prefix. Returns the time from
+    the start of the shard to the first one (None if there is none) and the
+    count.
+    """
+    first_tictoc = None
+    solution_count = 0
+    t1 = time.time()
+    for _ in _worker_solver.generate_valid_orderings(_worker_constraints, prefix):
+        solution_count += 1
+        if first_tictoc is None:
+            first_tictoc = time.time() - t1
+    return first_tictoc, solution_count
 
 class MagicianAgeOrderingSolver(object):
 
@@ -12,8 +37,19 @@ class MagicianAgeOrderingSolver(object):
     constaints generator and checks all possible orderings
     of our n magicians against the generated constaints.
 
+    Orderings are built prefix by prefix, so that a prefix that already
+    violates a constraint is discarded with every ordering extending it.
+    A constraint is decided as soon as its third wizard is placed: it holds
+    iff both or none of the two others are placed before it.
+
     The number of possible solutions (orderings) is returned
     in addition to the time taken to find the number of solutions.
+
+    With processes > 1, the orderings are split into shards by their first
+    few wizards, and the shards are counted in a pool of worker processes
+    that each receive the constraints once. Inside a daemonic process, e.g.
+    a worker of a parallel DifficultInputGenerator sweep, which can't have
+    children, they are counted serially instead.
     """
 
     """Enum constants for generator type"""
@@ -22,19 +58,26 @@ class MagicianAgeOrderingSolver(object):
     BALANCED = 2
     INWARD_MERGE = 3
 
+    """Smallest n worth the cost of starting a pool of processes"""
+    MIN_SHARDED_WIZARDS = 9
+    """Shards per process, so that uneven shards still balance out"""
+    SHARDS_PER_PROCESS = 8
 
-    def __init__(self, n, generator_type=0):
+
+    def __init__(self, n, generator_type=0, processes=1):
         self.num_wizards = n
         self.gen_type = generator_type
         self.wizard_list = [str(i) for i in range(self.num_wizards)]
-        self.wizard_permutations = self.generate_permutations()
-        shuffle(self.wizard_permutations)
+        self.processes = processes
 
     def solve(self, constraints):
         """
         This function will iterate through all possible ordering of our wizard list,
         and given the constraints that we have generated, will test the ordering for validity.
         """
+        if self.processes > 1 and self.num_wizards >= self.MIN_SHARDED_WIZARDS \
+                and not multiprocessing.current_process().daemon:
+            return self.solve_sharded(constraints)
         solution_count = 0
         solution_found = False
 
@@ -42,20 +85,156 @@ class MagicianAgeOrderingSolver(object):
         t1 = time.time()
         t2 = t1
 
-        for wizard_ordering in self.wizard_permutations:
-            if self.check_constraints(wizard_ordering, constraints):
-                solution_count +=1
-                if (not solution_found):
-                    solution_found = True
-                    t2 = time.time()
+        for wizard_ordering in self.generate_valid_orderings(constraints):
+            solution_count +=1
+            if (not solution_found):
+                solution_found = True
+                t2 = time.time()
         return t2 - t1, solution_count
 
     def generate_permutations(self):
         """
         Returning all possible permutations of the original list of wizards that we have.
         """
-        return list(itertools.permutations(self.wizard_list))
+        return itertools.permutations(self.wizard_list)
+
+    def solve_sharded(self, constraints):
+        """
+        Same as solve, counting shards of the orderings in parallel. The time
+        to the first solution is the shortest time from the start of a shard
+        to its first solution, so that the cost of splitting the orderings
+        and of starting the pool, which doesn't depend on the constraints,
+        is left out.
+        """
+        shards = self.generate_shards(constraints, self.processes * self.SHARDS_PER_PROCESS)
+        pool = multiprocessing.Pool(self.processes, initializer=_init_shard_worker,
+                                    initargs=(self.num_wizards, constraints))
+        try:
+            results = pool.map(_solve_shard, shards, chunksize=1)
+        finally:
+            pool.terminate()
+        first_tictocs = [t for t, _ in results if t is not None]
+        first_tictoc = min(first_tictocs) if first_tictocs else 0
+        return first_tictoc, sum(count for _, count in results)
+
+    def generate_shards(self, constraints, min_shards):
+        """
+        Returns the valid prefixes of the shortest length giving at least
+        min_shards of them (or of length n), which together cover every
+        valid ordering.
+        """
+        for length in range(self.num_wizards + 1):
+            shards = list(self.generate_valid_orderings(constraints, length=length))
+            if len(shards) >= min_shards:
+                break
+        return shards
+
+    def generate_valid_orderings(self, constraints, prefix=(), length=None):
+        """
+        Yields the orderings of our wizards satisfying all the constraints,
+        one at a time. Wizards are tried in a random order at every position,
+        so the time to the first solution is not biased by the wizard names.
+
+        Input:
+            prefix: wizards every yielded ordering starts with, assumed not
+                    to violate any constraint
+            length: yield the valid prefixes of this length instead
+        """
+        if length is None:
+            length = self.num_wizards
+        # constraints_on[w] lists the two other wizards of each constraint on w
+        constraints_on = {w: [] for w in self.wizard_list}
+        for c in constraints:
+            if c[2] == c[0] or c[2] == c[1]:
+                # a wizard is never strictly before or after itself
+                return
+            constraints_on[c[2]].append((c[0], c[1]))
+
+        candidates = self.wizard_list[:]
+        shuffle(candidates)
+        placed = set(prefix)
+        prefix = list(prefix)
+
+        def extend():
+            if len(prefix) == length:
+                yield tuple(prefix)
+                return
+            for w in candidates:
+                if w in placed:
+                    continue
+                if any((a in placed) != (b in placed) for a, b in constraints_on[w]):
+                    continue
+                placed.add(w)
+                prefix.append(w)
+                yield from extend()
+                prefix.pop()
+                placed.remove(w)
+
+        yield from extend()
+
+
+    def solve_by_swaps(self, constraints):
+        """
+        Same as solve, enumerating every permutation with Heap's algorithm
+        instead of pruning prefixes. Each permutation differs from the
+        previous one by a single swap, so the positions are updated in O(1)
+        instead of being rebuilt for every permutation.
+        """
+        solution_count = 0
+        t1 = time.time()
+        t2 = t1
+        for wizard_ordering in self.generate_orderings_by_swaps(constraints):
+            solution_count += 1
+            if solution_count == 1:
+                t2 = time.time()
+        return t2 - t1, solution_count
+
+    def generate_orderings_by_swaps(self, constraints):
+        """
+        Yields the orderings of our wizards satisfying all the constraints,
+        visiting all n! permutations in Heap's order from a shuffled start.
+
+        Most permutations are rejected by their first violated constraint,
+        so constraints are checked most frequently failing first: whenever
+        a constraint rejects a permutation, it moves one step up the order.
+        """
+        index = {w: i for i, w in enumerate(self.wizard_list)}
+        constraints = [tuple(index[w] for w in c) for c in constraints]
+        if any(c[2] == c[0] or c[2] == c[1] for c in constraints):
+            # a wizard is never strictly before or after itself
+            return
+
+        ordering = list(range(self.num_wizards))
+        shuffle(ordering)
+        pos = [0] * self.num_wizards
+        for p, w in enumerate(ordering):
+            pos[w] = p
+
+        def is_valid():
+            for i, (a, b, c) in enumerate(constraints):
+                if (pos[c] - pos[a]) * (pos[c] - pos[b]) < 0:
+                    if i > 0:
+                        constraints[i - 1], constraints[i] = constraints[i], constraints[i - 1]
+                    return False
+            return True
 
+        if is_valid():
+            yield tuple(self.wizard_list[w] for w in ordering)
+        counters = [0] * self.num_wizards
+        i = 1
+        while i < self.num_wizards:
+            if counters[i] < i:
+                p = 0 if i % 2 == 0 else counters[i]
+                x, y = ordering[p], ordering[i]
+                ordering[p], ordering[i] = y, x
+                pos[x], pos[y] = i, p
+                if is_valid():
+                    yield tuple(self.wizard_list[w] for w in ordering)
+                counters[i] += 1
+                i = 1
+            else:
+                counters[i] = 0
+                i += 1
 
     def check_constraints(self, wizard_ordering, constraints):
         """
@@ -0,0 +1,106 @@
+import os
+import numpy as np
+
+class ResultStore(object):
+    """
+    Result Store class.
+
+    Append-only columnar store of DifficultInputGenerator experiments, with
+    one fixed size binary record per repetition:
+
+        (n, k, generator, seed, rep, first_tictoc, solution_count)
+
+    where generator is the ConstraintGenerator type (-1 if unknown), seed
+    identifies the sweep, and an experiment with no valid constraints has
+    NaN results. Solution counts are stored as floats since they outgrow
+    64-bit integers past 20 magicians.
+
+    Records are only ever appended, so a file can be memory-mapped and
+    aggregated across any number of sweeps without parsing it. A record
+    cut short by a crash is ignored by the loader, and dropped by the next
+    append so that the records after it stay aligned.
+    """
+
+    DTYPE = np.dtype([
+        ('n', '<i4'),
+        ('k', '<i4'),
+        ('generator', '<i4'),
+        ('seed', '<i8'),
+        ('rep', '<i4'),
+        ('first_tictoc', '<f8'),
+        ('solution_count', '<f8'),
+    ])
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def append(self, rows):
+        """Appends a list of (n, k, generator, seed, rep, first_tictoc,
+        solution_count) rows, None results meaning no valid constraints."""
+        records = np.array([
+            row[:5] + tuple(np.nan if v is None else v for v in row[5:]) for row in rows
+        ], dtype=self.DTYPE)
+        mode = 'r+b' if os.path.exists(self.filename) else 'wb'
+        with open(self.filename, mode) as f:
+            f.seek(0, os.SEEK_END)
+            f.truncate(f.tell() // self.DTYPE.itemsize * self.DTYPE.itemsize)
+            f.seek(0, os.SEEK_END)
+            f.write(records.tobytes())
+
+    def load(self):
+        """Returns the records as a read-only memory-mapped structured array."""
+        if not os.path.exists(self.filename):
+            return np.zeros(0, dtype=self.DTYPE)
+        num_records = os.path.getsize(self.filename) // self.DTYPE.itemsize
+        if num_records == 0:
+            return np.zeros(0, dtype=self.DTYPE)
+        return np.memmap(self.filename, dtype=self.DTYPE, mode='r', shape=(num_records,))
+
+    def aggregate(self, n, generator=None, seed=None):
+        """
+        Aggregates the experiments on n magicians (of one generator and one
+        sweep if given) by k, counting a repetition recorded twice, e.g. by
+        a resumed sweep, once.
+
+        Output:
+            a dict of arrays indexed like its 'k' array: 'reps', the number
+            of valid experiments, and the 'avg_', 'max_' and 'min_' of
+            'first_tictoc' and 'solution_count' (0, 0 and inf for a k
+            with no valid experiment, as in ExperimentStats)
+        """
+        records = self.load()
+        selected = records['n'] == n
+        if generator is not None:
+            selected &= records['generator'] == generator
+        if seed is not None:
+            selected &= records['seed'] == seed
+        records = np.asarray(records[selected])
+        keys = ('k', 'generator', 'seed', 'rep')
+        records = records[np.lexsort([records[key] for key in reversed(keys)])]
+        repeated = np.zeros(len(records), dtype=bool)
+        if len(records):
+            repeated[1:] = True
+            for key in keys:
+                repeated[1:] &= records[key][1:] == records[key][:-1]
+        records = records[~repeated]
+
+        k, starts = np.unique(records['k'], return_index=True)
+        aggregated = {'k': k}
+        if not len(k):
+            aggregated['reps'] = np.zeros(0, dtype=np.int64)
+            for column in ('first_tictoc', 'solution_count'):
+                for prefix in ('avg_', 'max_', 'min_'):
+                    aggregated[prefix + column] = np.zeros(0)
+            return aggregated
+
+        valid = ~np.isnan(records['first_tictoc'])
+        reps = np.add.reduceat(valid.astype(np.int64), starts)
+        aggregated['reps'] = reps
+        for column in ('first_tictoc', 'solution_count'):
+            values = records[column]
+            total = np.add.reduceat(np.where(valid, values, 0), starts)
+            aggregated['avg_' + column] = np.where(reps > 0, total / np.maximum(reps, 1), 0)
+            highest = np.maximum.reduceat(np.where(valid, values, -np.inf), starts)
+            aggregated['max_' + column] = np.where(reps > 0, highest, 0)
+            aggregated['min_' + column] = np.minimum.reduceat(np.where(valid, values, np.inf), starts)
+        return aggregated
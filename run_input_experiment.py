@@ -1,6 +1,8 @@
+from multiprocessing import cpu_count
+
 from input_generator import DifficultInputGenerator
 from constraint_generator import ConstraintGenerator
-from solver import MagicianAgeOrderingSolver
+from naive_solver import MagicianAgeOrderingSolver
 
 N = 5
 K = 100
@@ -9,9 +11,11 @@ print("Running experiment for RANDOM Constraint Strategy.")
 constraint_constructor = ConstraintGenerator(N, ConstraintGenerator.RANDOM)
 problem_solver = MagicianAgeOrderingSolver(N, MagicianAgeOrderingSolver.RANDOM)
 input_generator = DifficultInputGenerator(constraint_constructor.generate, \
-                                          problem_solver.solve, K)
+                                          problem_solver.solve, K, \
+                                          ConstraintGenerator.RANDOM)
 
-ratio = input_generator.find_best_constraint_to_magicians_ratio(N)
+ratio = input_generator.find_best_constraint_to_magicians_ratio(N, processes=cpu_count(), tolerance=0.05,
+                                                               coarse_step=16)
 print("The best k to n ratio is: {0}\n\n".format(ratio))
 
 
@@ -19,9 +23,11 @@ print("Running experiment for SINGLE_SIDE_NEIGHBOR Constraint Strategy.")
 constraint_constructor = ConstraintGenerator(N, ConstraintGenerator.SINGLE_SIDE_NEIGHBOR)
 problem_solver = MagicianAgeOrderingSolver(N, MagicianAgeOrderingSolver.RANDOM)
 input_generator = DifficultInputGenerator(constraint_constructor.generate, \
-                                          problem_solver.solve, K)
+                                          problem_solver.solve, K, \
+                                          ConstraintGenerator.SINGLE_SIDE_NEIGHBOR)
 
-ratio = input_generator.find_best_constraint_to_magicians_ratio(N)
+ratio = input_generator.find_best_constraint_to_magicians_ratio(N, processes=cpu_count(), tolerance=0.05,
+                                                               coarse_step=16)
 print("The best k to n ratio is: {0}\n\n".format(ratio))
 
 
@@ -29,7 +35,9 @@ print("Running experiment for INWARD_MERGE Constraint Strategy.")
 constraint_constructor = ConstraintGenerator(N, ConstraintGenerator.INWARD_MERGE)
 problem_solver = MagicianAgeOrderingSolver(N, MagicianAgeOrderingSolver.RANDOM)
 input_generator = DifficultInputGenerator(constraint_constructor.generate, \
-                                          problem_solver.solve, K)
+                                          problem_solver.solve, K, \
+                                          ConstraintGenerator.INWARD_MERGE)
 
-ratio = input_generator.find_best_constraint_to_magicians_ratio(N)
+ratio = input_generator.find_best_constraint_to_magicians_ratio(N, processes=cpu_count(), tolerance=0.05,
+                                                               coarse_step=16)
 print("The best k to n ratio is: {0}\n\n".format(ratio))
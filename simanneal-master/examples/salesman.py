@@ -24,10 +24,18 @@ class TravellingSalesmanProblem(Annealer):
         super(TravellingSalesmanProblem, self).__init__(state)  # important!
 
     def move(self):
-        """Swaps two cities in the route."""
+        """Swaps two cities in the route and returns the change in length."""
         a = random.randint(0, len(self.state) - 1)
         b = random.randint(0, len(self.state) - 1)
+        # only the legs ending at and leaving from a and b change
+        legs = set(i % len(self.state) for i in (a, a + 1, b, b + 1))
+        initial_length = self.legs_length(legs)
         self.state[a], self.state[b] = self.state[b], self.state[a]
+        return self.legs_length(legs) - initial_length
+
+    def legs_length(self, legs):
+        """Calculates the length of the given legs, leg i ending at city i."""
+        return sum(self.distance_matrix[self.state[i-1]][self.state[i]] for i in legs)
 
     def energy(self):
         """Calculates the length of the route."""
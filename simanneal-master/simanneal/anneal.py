@@ -43,6 +43,9 @@ class Annealer(object):
     copy_strategy = 'deepcopy'
     user_exit = False
     save_state_on_exit = False
+    # source of the uniforms of the acceptance test, any object with a
+    # random() method like the random module (the default)
+    rng = random
 
     # placeholders
     best_state = None
@@ -75,7 +78,12 @@ class Annealer(object):
 
     @abc.abstractmethod
     def move(self):
-        """Create a state change"""
+        """Create a state change
+
+        May return the resulting change in energy, in which case the
+        annealer uses it instead of calling `energy` after the move.
+        Returning None keeps the full `energy` evaluation.
+        """
         pass
 
     @abc.abstractmethod
@@ -115,6 +123,31 @@ class Annealer(object):
                                'the self.copy_strategy "%s"' %
                                self.copy_strategy)
 
+    def commit(self):
+        """Marks the current state as accepted.
+
+        Subclasses that keep bookkeeping derived from the state (e.g. an
+        incrementally maintained energy) can override `commit` and
+        `rollback` together to save and restore it as well.  Overriding
+        them with an undo log of the changes made by `move` avoids copying
+        the state on every step; `anneal` then only copies the state when
+        it reaches a new best energy.
+        """
+        self.committed_state = self.copy_state(self.state)
+
+    def rollback(self):
+        """Restores the state saved by the last call to `commit`."""
+        self.state = self.copy_state(self.committed_state)
+
+    def set_state(self, state):
+        """Makes a copy of `state` the current state, e.g. the best state
+        at the end of `anneal`.
+
+        Subclasses that keep bookkeeping derived from the state should
+        override it to rebuild that bookkeeping too.
+        """
+        self.state = self.copy_state(state)
+
     def update(self, *args, **kwargs):
         """Wrapper for internal update.
 
@@ -180,8 +213,7 @@ class Annealer(object):
         # Note initial state
         T = self.Tmax
         E = self.energy()
-        prevState = self.copy_state(self.state)
-        prevDict = self.copy_state(self.wiz_to_pos)
+        self.commit()
         prevEnergy = E
         self.best_state = self.copy_state(self.state)
         self.best_energy = E
@@ -194,22 +226,23 @@ class Annealer(object):
         while step < self.steps and not self.user_exit:
             step += 1
             T = self.Tmax * math.exp(Tfactor * step / self.steps)
-            self.move()
-            E = self.energy()
-            dE = E - prevEnergy
+            dE = self.move()
+            if dE is None:
+                E = self.energy()
+                dE = E - prevEnergy
+            else:
+                E = prevEnergy + dE
             trials += 1
-            if dE > 0.0 and math.exp(-dE / T) < random.random():
+            if dE > 0.0 and math.exp(-dE / T) < self.rng.random():
                 # Restore previous state
-                self.state = self.copy_state(prevState)
-                self.wiz_to_pos = self.copy_state(prevDict)
+                self.rollback()
                 E = prevEnergy
             else:
                 # Accept new state and compare to best state
                 accepts += 1
                 if dE < 0.0:
                     improves += 1
-                prevState = self.copy_state(self.state)
-                prevDict = self.copy_state(self.wiz_to_pos)
+                self.commit()
                 prevEnergy = E
                 if E < self.best_energy:
                     self.best_state = self.copy_state(self.state)
@@ -220,13 +253,43 @@ class Annealer(object):
                         step, T, E, accepts / trials, improves / trials)
                     trials, accepts, improves = 0, 0, 0
 
-        self.state = self.copy_state(self.best_state)
+        self.set_state(self.best_state)
         if self.save_state_on_exit:
             self.save_state()
 
         # Return best state and energy
         return self.best_state, self.best_energy
 
+    def run_at(self, T, steps):
+        """Anneals a system at constant temperature and returns the
+        energy, rate of acceptance, and rate of improvement.
+
+        Stops early if the user_exit flag is raised.
+        """
+        E = self.energy()
+        self.commit()
+        prevEnergy = E
+        trials, accepts, improves = 0, 0, 0
+        while trials < steps and not self.user_exit:
+            trials += 1
+            dE = self.move()
+            if dE is None:
+                E = self.energy()
+                dE = E - prevEnergy
+            else:
+                E = prevEnergy + dE
+            if dE > 0.0 and math.exp(-dE / T) < self.rng.random():
+                self.rollback()
+                E = prevEnergy
+            else:
+                accepts += 1
+                if dE < 0.0:
+                    improves += 1
+                self.commit()
+                prevEnergy = E
+        trials = max(trials, 1)
+        return E, float(accepts) / trials, float(improves) / trials
+
     def auto(self, minutes, steps=2000):
         """Explores the annealing landscape and
         estimates optimal temperature settings.
@@ -234,28 +297,6 @@ class Annealer(object):
         Returns a dictionary suitable for the `set_schedule` method.
         """
 
-        def run(T, steps):
-            """Anneals a system at constant temperature and returns the state,
-            energy, rate of acceptance, and rate of improvement."""
-            E = self.energy()
-            prevState = self.copy_state(self.state)
-            prevEnergy = E
-            accepts, improves = 0, 0
-            for _ in range(steps):
-                self.move()
-                E = self.energy()
-                dE = E - prevEnergy
-                if dE > 0.0 and math.exp(-dE / T) < random.random():
-                    self.state = self.copy_state(prevState)
-                    E = prevEnergy
-                else:
-                    accepts += 1
-                    if dE < 0.0:
-                        improves += 1
-                    prevState = self.copy_state(self.state)
-                    prevEnergy = E
-            return E, float(accepts) / steps, float(improves) / steps
-
         step = 0
         self.start = time.time()
 
@@ -264,23 +305,28 @@ class Annealer(object):
         T = 0.0
         E = self.energy()
         self.update(step, T, E, None, None)
+        movedEnergy = E
         while T == 0.0:
             step += 1
-            self.move()
-            T = abs(self.energy() - E)
+            dE = self.move()
+            if dE is None:
+                movedEnergy = self.energy()
+            else:
+                movedEnergy += dE
+            T = abs(movedEnergy - E)
 
         # Search for Tmax - a temperature that gives 98% acceptance
-        E, acceptance, improvement = run(T, steps)
+        E, acceptance, improvement = self.run_at(T, steps)
 
         step += steps
         while acceptance > 0.98:
             T = round_figures(T / 1.5, 2)
-            E, acceptance, improvement = run(T, steps)
+            E, acceptance, improvement = self.run_at(T, steps)
             step += steps
             self.update(step, T, E, acceptance, improvement)
         while acceptance < 0.98:
             T = round_figures(T * 1.5, 2)
-            E, acceptance, improvement = run(T, steps)
+            E, acceptance, improvement = self.run_at(T, steps)
             step += steps
             self.update(step, T, E, acceptance, improvement)
         Tmax = T
@@ -288,7 +334,7 @@ class Annealer(object):
         # Search for Tmin - a temperature that gives 0% improvement
         while improvement > 0.0:
             T = round_figures(T / 1.5, 2)
-            E, acceptance, improvement = run(T, steps)
+            E, acceptance, improvement = self.run_at(T, steps)
             step += steps
             self.update(step, T, E, acceptance, improvement)
         Tmin = T
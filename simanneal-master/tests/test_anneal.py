@@ -28,6 +28,20 @@ class TravellingSalesmanProblem(Annealer):
         return e
 
 
+class DeltaTravellingSalesmanProblem(TravellingSalesmanProblem):
+    """Test annealer whose move returns the change in energy.
+    """
+
+    def move(self):
+        initial_energy = self.energy()
+        super(DeltaTravellingSalesmanProblem, self).move()
+        return self.energy() - initial_energy
+
+    def energy(self):
+        self.energy_calls += 1
+        return super(DeltaTravellingSalesmanProblem, self).energy()
+
+
 def test_tsp_example():
     # initial state, a randomly-ordered itinerary
     init_state = list(cities.keys())
@@ -46,6 +60,23 @@ def test_tsp_example():
     assert len(state) == len(cities)
 
 
+def test_move_returning_delta():
+    init_state = list(cities.keys())
+    random.shuffle(init_state)
+
+    tsp = DeltaTravellingSalesmanProblem(init_state, distance_matrix)
+    tsp.copy_strategy = "slice"
+    tsp.steps = 1000
+    tsp.updates = 0
+    tsp.energy_calls = 0
+
+    state, e = tsp.anneal()
+
+    # one call up front, then two per move from the move itself
+    assert tsp.energy_calls == 1 + 2 * tsp.steps
+    assert abs(e - tsp.energy()) < 1e-6 * e
+
+
 def test_auto():
     # initial state, a randomly-ordered itinerary
     init_state = list(cities.keys())
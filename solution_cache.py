@@ -0,0 +1,137 @@
+from __future__ import print_function
+import hashlib
+import os
+import sqlite3
+import sys
+import time
+from itertools import groupby
+
+from atomic_write import atomic_write
+
+"""
+Content-addressed cache of solved instances.
+
+#how to run:
+#python solution_cache.py cache_dir add input.in output.out
+#   stores an existing solution, e.g. from solutions/ or phase3_outputs/
+"""
+
+class SolutionCache(object):
+    """
+    Solution Cache class.
+
+    Stores orderings (as wizard names) under the hash of their canonical
+    instance: the constraints with their two outer wizards sorted,
+    deduplicated and sorted, as solver.solve does. Instances that only
+    differ by the order or repetition of their constraint lines therefore
+    share a cache entry.
+
+    Entries live in cache_dir as <hash>.out files spread over 256
+    subdirectories, next to an index.sqlite database recording each entry's
+    size and last use. Any number of processes can share a cache_dir: a hit
+    only updates the last use of its own entry, and writes and evictions
+    run in one transaction at a time. When the entries exceed max_bytes,
+    the least recently used ones are evicted.
+    """
+
+    INDEX = 'index.sqlite'
+
+    def __init__(self, cache_dir, max_bytes=256 * 2**20):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # other processes sharing the cache may be creating it too
+        os.makedirs(cache_dir, exist_ok=True)
+        # autocommit, transactions are opened explicitly where needed
+        self.index = sqlite3.connect(os.path.join(cache_dir, self.INDEX), timeout=60,
+                                     isolation_level=None)
+        self.index.execute("CREATE TABLE IF NOT EXISTS entries "
+                           "(key TEXT PRIMARY KEY, size INTEGER NOT NULL, last_used REAL NOT NULL)")
+
+    @staticmethod
+    def key(constraints):
+        """
+        Returns the hash of the canonical form of an instance, given its
+        constraints as 3-sequences of wizard names.
+        """
+        canonical = [(min(a, b), max(a, b), c) for a, b, c in constraints]
+        canonical = [k for k, v in groupby(sorted(canonical))]
+        digest = hashlib.sha256()
+        for c in canonical:
+            digest.update(" ".join(c).encode('utf-8'))
+            digest.update(b"\n")
+        return digest.hexdigest()
+
+    def get(self, constraints):
+        """
+        Returns the cached ordering of wizard names for an instance, or None.
+        The ordering is not checked against the constraints here.
+        """
+        key = self.key(constraints)
+        if self.index.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone() is None:
+            return None
+        try:
+            with open(self._path(key)) as f:
+                ordering = f.read().split()
+        except IOError:
+            # removed behind our back, e.g. by another process evicting it
+            self.index.execute("DELETE FROM entries WHERE key = ?", (key,))
+            return None
+        self.index.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        return ordering
+
+    def put(self, constraints, ordering):
+        """Stores an ordering of wizard names for an instance."""
+        key = self.key(constraints)
+        path = self._path(key)
+        contents = " ".join(ordering)
+        # the file and its entry change together, so no other process
+        # evicts one without the other in between
+        self.index.execute("BEGIN IMMEDIATE")
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with atomic_write(path) as f:
+                f.write(contents)
+            self.index.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+                               (key, len(contents), time.time()))
+            self._evict()
+            self.index.execute("COMMIT")
+        except BaseException:
+            self.index.execute("ROLLBACK")
+            raise
+
+    def _evict(self):
+        total, = self.index.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in self.index.execute("SELECT key, size FROM entries ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            total -= size
+            evicted.append(key)
+        for key in evicted:
+            self.index.execute("DELETE FROM entries WHERE key = ?", (key,))
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.out')
+
+def main(argv):
+    if len(argv) != 4 or argv[1] != 'add':
+        print("Usage: python solution_cache.py [cache_dir] add [path_to_input_file] [path_to_output_file]")
+        return
+    cache = SolutionCache(argv[0])
+    with open(argv[2]) as f:
+        f.readline(), f.readline()
+        constraints = [line.split() for line in f if line.split()]
+    with open(argv[3]) as f:
+        ordering = f.read().split()
+    cache.put(constraints, ordering)
+    print("Cached", argv[3], "as", cache.key(constraints))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
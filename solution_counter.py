@@ -0,0 +1,110 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class SolutionCounter(object):
+
+    """
+    Solution Counter Class
+
+    Counts the orderings of our n magicians satisfying a list of
+    constraints without enumerating them, as a drop-in replacement for
+    MagicianAgeOrderingSolver.solve in DifficultInputGenerator experiments.
+
+    When orderings are built left to right, a constraint is decided when its
+    third wizard is placed, and only depends on which wizards were placed
+    before it, not on their order. So the number of valid orderings of every
+    set S of wizards placed first satisfies
+
+        count[S + w] = sum of count[S] over the w that can be placed after S
+
+    which is a dynamic program over the 2^n subsets, in O(2^n * n * deg).
+    Subsets are bitmasks; with NumPy, each popcount level of subsets is
+    extended in bulk.
+    """
+
+    # largest n whose counts (up to n!) fit in an int64
+    MAX_INT64_WIZARDS = 20
+
+    def __init__(self, n, use_numpy=None):
+        """
+        Input:
+            n: number of magicians
+            use_numpy: whether to run the NumPy version of the program,
+                       defaults to whether NumPy is available
+        """
+        self.num_wizards = n
+        self.wizard_list = [str(i) for i in range(self.num_wizards)]
+        if use_numpy and np is None:
+            raise ImportError("NumPy is required for use_numpy=True")
+        self.use_numpy = np is not None if use_numpy is None else use_numpy
+
+    def solve(self, constraints):
+        """
+        Same interface as MagicianAgeOrderingSolver.solve, but only the
+        solution count is valid: no ordering is found before the whole
+        program is run, whose time depends on 2^n rather than on the
+        constraints, so the time to first solution is always zero.
+        """
+        return 0, self.count(constraints)
+
+    def count(self, constraints):
+        """
+        Returns the number of orderings of our wizards satisfying all the
+        constraints, given as 3-sequences of wizard names.
+        """
+        index = {w: i for i, w in enumerate(self.wizard_list)}
+        # constraints_on[w] lists the two other wizards of each constraint on w
+        constraints_on = [[] for _ in range(self.num_wizards)]
+        for c in constraints:
+            a, b, target = index[c[0]], index[c[1]], index[c[2]]
+            if target == a or target == b:
+                # a wizard is never strictly before or after itself
+                return 0
+            constraints_on[target].append((a, b))
+
+        if self.use_numpy:
+            return self._count_numpy(constraints_on)
+        return self._count_python(constraints_on)
+
+    def _count_python(self, constraints_on):
+        n = self.num_wizards
+        counts = [0] * (1 << n)
+        counts[0] = 1
+        # S + w > S, so increasing order visits every subset after its parts
+        for placed in range(1 << n):
+            count = counts[placed]
+            if not count:
+                continue
+            for w in range(n):
+                if placed >> w & 1:
+                    continue
+                if any(placed >> a & 1 != placed >> b & 1 for a, b in constraints_on[w]):
+                    continue
+                counts[placed | 1 << w] += count
+        return counts[-1]
+
+    def _count_numpy(self, constraints_on):
+        n = self.num_wizards
+        subsets = np.arange(1 << n, dtype=np.int64)
+        popcount = np.zeros(1 << n, dtype=np.int8)
+        for w in range(n):
+            popcount += (subsets >> w & 1).astype(np.int8)
+        by_level = np.argsort(popcount, kind='stable')
+        level_starts = np.searchsorted(popcount[by_level], np.arange(n + 1))
+
+        # counts overflow an int64 past 20!, fall back to Python ints there
+        dtype = np.int64 if n <= self.MAX_INT64_WIZARDS else object
+        counts = np.zeros(1 << n, dtype=dtype)
+        counts[0] = 1
+        for level in range(n):
+            placed = by_level[level_starts[level]:level_starts[level + 1]]
+            placed = placed[counts[placed] != 0]
+            for w in range(n):
+                allowed = placed[(placed >> w & 1) == 0]
+                for a, b in constraints_on[w]:
+                    allowed = allowed[(allowed >> a & 1) == (allowed >> b & 1)]
+                # S -> S + w is one to one, so no index repeats here
+                counts[allowed | 1 << w] += counts[allowed]
+        return int(counts[-1])
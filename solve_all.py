@@ -1,11 +1,153 @@
+from __future__ import print_function
+import argparse
+import csv
+import glob
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import cpu_count
 
-inputs = os.listdir('./phase3_inputs')
-print 'Input files to be processed: \n\n', inputs
+from atomic_write import atomic_write
+from constraint_matrix import ConstraintMatrix
+from solution_cache import SolutionCache
+from solver import format_output, read_input, solve, valid_state
 
-for i in inputs:
-    print 'Running ' + i
-    if os.system('python solver.py phase3_inputs/' + i + ' phase3_outputs/' + i):
-        exit()
-    print 'Solved ' + i
-    os.remove('phase3_inputs/' + i)
+"""
+Solves every instance of a directory (or glob) of .in files in a bounded pool
+of worker processes, writing each output atomically and a summary report.
+
+#how to run:
+#python solve_all.py phase3_inputs -o phase3_outputs -j 4 --time-limit 600
+"""
+
+def find_inputs(inputs):
+    """Returns the sorted .in files of a directory, or the files matching a glob."""
+    if os.path.isdir(inputs):
+        inputs = os.path.join(inputs, '*.in')
+    return sorted(glob.glob(inputs))
+
+def write_atomically(filename, solution, names):
+    """Writes the output to a temporary file first, so that an interrupted
+    batch never leaves a truncated output behind."""
+    with atomic_write(filename) as f:
+        f.write(format_output(solution, names))
+
+def is_solved(input_file, output_file):
+    """Whether output_file exists and satisfies every constraint of input_file."""
+    if not os.path.exists(output_file):
+        return False
+    _, _, _, constraints, _, names = read_input(input_file)
+    with open(output_file) as f:
+        ordering = f.read().split()
+    return valid_state(ordering, names, constraints) is not None
+
+def solve_instance(input_file, output_file, time_limit, retries, cache_dir=None):
+    """
+    Solves one instance, retrying with a fresh seed while it is not solved
+    within time_limit seconds. Returns a row of the summary report.
+    """
+    start = time.time()
+    cache = SolutionCache(cache_dir) if cache_dir else None
+    num_wizards, num_constraints, wizards, constraints, identifier, names = read_input(input_file)
+    matrix = ConstraintMatrix(len(wizards), constraints)
+    best_solution, best_energy = None, None
+    attempts = 0
+    while attempts <= retries:
+        attempts += 1
+        solution = solve(num_wizards, num_constraints, wizards, constraints, identifier,
+                         output_file, names, time_limit=time_limit, cache=cache)
+        energy = matrix.count_violated(matrix.positions(solution))
+        if best_energy is None or energy < best_energy:
+            best_solution, best_energy = solution, energy
+        if energy == 0:
+            break
+    write_atomically(output_file, best_solution, names)
+    return {
+        'input': input_file,
+        'status': 'solved' if best_energy == 0 else 'unsolved',
+        'attempts': attempts,
+        'seconds': round(time.time() - start, 3),
+        'energy': best_energy,
+    }
+
+def solve_all(inputs, output_dir, jobs, time_limit, retries, overwrite=False, cache_dir=None):
+    """
+    Solves all the input files in a pool of jobs worker processes. Inputs
+    whose output already satisfies every constraint are skipped unless
+    overwrite is set, so a rerun resumes an interrupted batch and retries
+    the instances left unsolved. Returns the summary rows of the inputs
+    solved in this run.
+    """
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    rows = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {}
+        for input_file in find_inputs(inputs):
+            output_file = os.path.join(output_dir, os.path.basename(input_file))
+            if not overwrite and is_solved(input_file, output_file):
+                print('Skipping ' + input_file + ', already solved')
+                continue
+            print('Running ' + input_file)
+            future = executor.submit(solve_instance, input_file, output_file, time_limit,
+                                     retries, cache_dir)
+            futures[future] = input_file
+        for future in as_completed(futures):
+            try:
+                row = future.result()
+            except Exception as e:
+                # a failing instance is reported without stopping the batch
+                row = {'input': futures[future], 'status': 'error: {0}'.format(e),
+                       'attempts': None, 'seconds': None, 'energy': None}
+            print('Finished {input}: {status} (energy {energy}, {seconds}s)'.format(**row))
+            rows.append(row)
+    rows.sort(key=lambda row: row['input'])
+    return rows
+
+def read_report(filename):
+    if not os.path.exists(filename):
+        return []
+    with open(filename) as f:
+        return list(csv.DictReader(f))
+
+def merge_report(filename, rows):
+    """
+    Returns the rows of an earlier report, if any, updated with the rows of
+    a rerun, so that the report of a resumed batch covers every input.
+    """
+    merged = {row['input']: row for row in read_report(filename)}
+    merged.update((row['input'], row) for row in rows)
+    return [merged[input_file] for input_file in sorted(merged)]
+
+def write_report(filename, rows):
+    with open(filename, 'w') as f:
+        writer = csv.DictWriter(f, fieldnames=['input', 'status', 'attempts', 'seconds', 'energy'])
+        writer.writeheader()
+        writer.writerows(rows)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Batch Constraint Solver.")
+    parser.add_argument("inputs", type=str, nargs='?', default='phase3_inputs',
+                        help = "directory of .in files, or a glob")
+    parser.add_argument("-o", "--output-dir", type=str, default='phase3_outputs')
+    parser.add_argument("-j", "--jobs", type=int, default=cpu_count(),
+                        help = "number of instances solved in parallel")
+    parser.add_argument("--time-limit", type=float, default=600,
+                        help = "seconds per attempt at an instance")
+    parser.add_argument("--retries", type=int, default=2,
+                        help = "extra attempts at an instance left unsolved")
+    parser.add_argument("--overwrite", action='store_true',
+                        help = "solve instances whose output already satisfies every constraint")
+    parser.add_argument("--cache", type=str, default=None,
+                        help = "directory of a solution cache to reuse solved instances from")
+    parser.add_argument("--report", type=str, default=None,
+                        help = "summary CSV, defaults to OUTPUT_DIR/summary.csv")
+    args = parser.parse_args()
+
+    rows = solve_all(args.inputs, args.output_dir, args.jobs, args.time_limit,
+                     args.retries, args.overwrite, args.cache)
+    report = args.report or os.path.join(args.output_dir, 'summary.csv')
+    rows = merge_report(report, rows)
+    write_report(report, rows)
+    solved = sum(1 for row in rows if row['status'] == 'solved')
+    print('Solved {0}/{1} instances'.format(solved, len(rows)))
@@ -1,7 +1,16 @@
 import argparse
+import multiprocessing
+import random
+import time
 from itertools import groupby
+from queue import Empty
 
-from wizards import NonBetweenness
+from constraint_matrix import ConstraintMatrix
+from exact_solver import BranchAndBoundSolver
+from islands import IslandModel
+from solution_cache import SolutionCache
+from tempering import ParallelTempering
+from wizards import greedy_ordering, worker_annealer
 
 """
 ======================================================================
@@ -9,18 +18,162 @@ from wizards import NonBetweenness
 ======================================================================
 """
 
-def solve(num_wizards, num_constraints, wizards, constraints, identifier, outfile):
+# NonBetweenness hyperparameters of the portfolio workers started from a
+# greedy_ordering, unless their portfolio entry sets them. Measured from 2
+# seeds on each of input35_0-4 and input50_0-4, the greedy start halves the
+# starting energy, but anneals only reach zero energy around T = 1.8 to
+# 2.0: below Tmax = 1.9 they get stuck (1 of 10 of the 35-wizard anneals
+# solved in 100000 steps at Tmax = 1.0, against 9 of 10 from a random
+# start at 2.0), and at 1.9 the median steps to zero is on par with a
+# random start (2700 against 2850).
+GREEDY_HYPERPARAMS = {'Tmax': 1.9}
+
+def anneal_restarts(queue, worker_id, seed, hyperparams, num_wizards, num_constraints, wizards, constraints,
+                    init=None):
+    """
+    Portfolio worker: keeps annealing, restarting from its best ordering, and
+    puts (worker_id, energy, ordering) on queue each time it improves. Runs
+    until it reaches zero energy or is terminated by solve(). With a greedy
+    init, GREEDY_HYPERPARAMS apply on top of the worker's hyperparameters.
+    """
+    annealer = worker_annealer(seed, num_wizards, num_constraints, wizards, constraints,
+                               shuffled=worker_id > 0 and init != 'greedy')
+    if init == 'greedy':
+        # ties are broken at random, so every worker gets its own start
+        annealer.set_state(greedy_ordering(wizards, constraints))
+    best_energy = [float("inf")]
+
+    def report(*args):
+        # used as the annealer's update, so progress is reported mid-anneal
+        if annealer.best_energy < best_energy[0]:
+            best_energy[0] = annealer.best_energy
+            queue.put((worker_id, annealer.best_energy, list(annealer.best_state)))
+
+    while best_energy[0] != 0:
+        if hyperparams is None:
+            annealer.randomize_hyperparams()
+        else:
+            for name, value in hyperparams.items():
+                setattr(annealer, name, value)
+        if init == 'greedy':
+            for name, value in GREEDY_HYPERPARAMS.items():
+                if hyperparams is None or name not in hyperparams:
+                    setattr(annealer, name, value)
+        annealer.updates = 100
+        annealer.update = report
+        state, energy = annealer.anneal()
+        report()
+        annealer = worker_annealer(None, num_wizards, num_constraints, state, constraints,
+                                   shuffled=False)
+
+# seconds between two checks that some portfolio worker is still alive
+POLL_INTERVAL = 1.0
+
+def run_portfolio(portfolio, num_wizards, num_constraints, wizards, constraints, time_limit, seed, init=None):
+    """
+    Runs one anneal_restarts process per portfolio entry until one of them
+    reaches zero energy or time_limit runs out, then cancels them all.
+    Also stops if every worker has died, e.g. of an exception. Returns the
+    best (ordering, energy) reported.
+    """
+    rng = random.Random(seed)
+    queue = multiprocessing.Queue()
+    processes = []
+    for worker_id, hyperparams in enumerate(portfolio):
+        process = multiprocessing.Process(
+            target=anneal_restarts,
+            args=(queue, worker_id, rng.getrandbits(64), hyperparams,
+                  num_wizards, num_constraints, wizards, constraints, init),
+        )
+        process.daemon = True
+        process.start()
+        processes.append(process)
+
+    best_state, best_energy = list(wizards), float("inf")
+    deadline = None if time_limit is None else time.time() + time_limit
+    try:
+        while best_energy != 0:
+            timeout = POLL_INTERVAL
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.time())
+                if timeout <= 0:
+                    break
+            try:
+                worker_id, energy, state = queue.get(timeout=timeout)
+            except Empty:
+                if not any(process.is_alive() for process in processes):
+                    print("All workers died, exit codes {0}".format(
+                        [process.exitcode for process in processes]))
+                    break
+                continue
+            if energy < best_energy:
+                best_state, best_energy = state, energy
+                print("Worker {0} reached energy {1}".format(worker_id, energy))
+    finally:
+        # the first worker to zero (or the deadline) cancels all the others
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+    return best_state, best_energy
+
+def valid_state(ordering, names, constraints):
+    """
+    Returns an ordering of wizard names as wizard ids, provided it is a
+    permutation of the wizards satisfying every constraint, or None.
+    """
+    if ordering is None or sorted(ordering) != sorted(names):
+        return None
+    name_to_id = {name: i for i, name in enumerate(names)}
+    state = [name_to_id[name] for name in ordering]
+    matrix = ConstraintMatrix(len(names), constraints)
+    if matrix.count_violated(matrix.positions(state)) != 0:
+        return None
+    return state
+
+def cached_solution(cache, constraints, names):
+    """
+    Returns the ordering of wizard ids cached for an instance, provided it
+    is a permutation of the wizards satisfying every constraint, or None.
+    """
+    return valid_state(cache.get([[names[w] for w in c] for c in constraints]), names, constraints)
+
+def solve(num_wizards, num_constraints, wizards, constraints, identifier, outfile, names=None,
+          replicas=0, islands=0, workers=1, time_limit=None, portfolio=None, seed=None,
+          cache=None, init=None, exact=0):
     """
     Write your algorithm here.
     Input:
         num_wizards: Number of wizards
         num_constraints: Number of constraints
-        wizards: An array of wizard names, in no particular order
-        constraints: A 2D-array of constraints,
-                     where constraints[0] may take the form ['A', 'B', 'C']i
+        wizards: An array of wizard ids, in no particular order
+        constraints: A list of constraints as 3-tuples of wizard ids,
+                     where constraints[0] may take the form (0, 1, 2)
+        names: The symbol table mapping wizard ids back to names
+        replicas: If > 0, solve with parallel tempering over this many
+                  replicas instead of a portfolio of restarting anneals
+        islands: If > 0, solve with this many migrating islands instead of a
+                 portfolio of restarting anneals
+        workers: Number of annealer processes in the portfolio
+        time_limit: Seconds after which the best ordering found so far is
+                    returned, or None to run until all constraints are met
+        portfolio: One dict of NonBetweenness hyperparameters (Tmax, Tmin,
+                   steps, batch_size...) per worker, None entries meaning
+                   randomized ones. Defaults to the standard hyperparameters
+                   for the first worker and randomized ones for the others.
+        seed: Seed from which the per-worker seeds are drawn
+        cache: A SolutionCache to look the instance up in before annealing,
+               and to store it in once solved (requires names)
+        init: 'greedy' to start every portfolio worker from its own
+              greedy_ordering instead of the given or a shuffled ordering,
+              annealing with GREEDY_HYPERPARAMS
+        exact: Seconds to spend on an exact branch and bound search before
+               annealing, 0 to skip it
 
     Output:
-        An array of wizard names in the ordering your algorithm returns
+        An array of wizard ids in the ordering your algorithm returns, or
+        None if the exact search proved that no ordering satisfies every
+        constraint
     """
     # To start with some ordering, specify it on the following line and uncomment.
     # wizards = []
@@ -28,24 +181,50 @@ def solve(num_wizards, num_constraints, wizards, constraints, identifier, outfil
 
     print("Num constraints before removing duplicates: ", len(constraints))
 
-    for constraint in constraints:
-        # sort the first two elements in the list
-        constraint[0], constraint[1] = min(constraint[0], constraint[1]), \
-            max(constraint[0], constraint[1])
+    # sort the first two elements in each constraint
+    constraints = [(min(a, b), max(a, b), c) for a, b, c in constraints]
     # remove duplicates
     constraints = [k for k,v in groupby(sorted(constraints))]
     print("Num constraints before after duplicates: ", len(constraints))
-    best_energy = 100 # arbitrary number > 0
-    while best_energy != 0:
-        solver = NonBetweenness(identifier, num_wizards, num_constraints, wizards, constraints, outfile)
-        print("Initial energy is " + str(solver.energy()))
-        # solver.print_violated_constraints()
-        wizard_assignment_array = solver.anneal()
-        best_state, best_energy = wizard_assignment_array
-        print("\nBest energy for this iteration is: " + str(best_energy))
-        print("Best state for this iteration is:", best_state)
-        wizards = best_state
-    return wizard_assignment_array
+
+    if cache is not None and names is not None:
+        state = cached_solution(cache, constraints, names)
+        if state is not None:
+            print("Found a valid cached solution")
+            return state
+
+    best_state, best_energy = None, None
+    if exact > 0:
+        search = BranchAndBoundSolver(len(wizards), constraints)
+        best_state = search.solve(exact)
+        if best_state is not None:
+            print("Found a solution by exact search in {0} nodes".format(search.nodes))
+            best_energy = 0
+        elif search.exhausted:
+            # annealing could only run until time_limit, or forever
+            print("Exact search proved that no ordering satisfies every constraint")
+            return None
+        else:
+            print("Exact search timed out after {0} nodes".format(search.nodes))
+
+    if best_state is not None:
+        pass
+    elif replicas > 0:
+        engine = ParallelTempering(num_wizards, num_constraints, wizards, constraints, replicas)
+        best_state, best_energy = engine.run(time_limit, seed)
+    elif islands > 0:
+        engine = IslandModel(num_wizards, num_constraints, wizards, constraints, islands)
+        best_state, best_energy = engine.run(time_limit, seed)
+    else:
+        if portfolio is None:
+            portfolio = [{}] + [None] * (workers - 1)
+        best_state, best_energy = run_portfolio(
+            portfolio, num_wizards, num_constraints, wizards, constraints, time_limit, seed, init)
+    print("\nBest energy is: " + str(best_energy))
+
+    if best_energy == 0 and cache is not None and names is not None:
+        cache.put([[names[w] for w in c] for c in constraints], [names[w] for w in best_state])
+    return best_state
 
 """
 ======================================================================
@@ -54,32 +233,63 @@ def solve(num_wizards, num_constraints, wizards, constraints, identifier, outfil
 """
 
 def read_input(filename):
+    """
+    Reads an instance, interning the wizard names into dense integer ids.
+    Wizards and constraints are returned as ids; names[i] is the name of
+    wizard i and is only needed again by write_output.
+    """
     with open(filename) as f:
         num_wizards = int(f.readline())
         num_constraints = int(f.readline())
         constraints = []
-        wizards = set()
+        names = []
+        name_to_id = {}
         for _ in range(num_constraints):
-            c = f.readline().split()
-            constraints.append(c)
-            for w in c:
-                wizards.add(w)
+            c = []
+            for w in f.readline().split():
+                if w not in name_to_id:
+                    name_to_id[w] = len(names)
+                    names.append(w)
+                c.append(name_to_id[w])
+            constraints.append(tuple(c))
 
-    wizards = list(wizards)
+    wizards = list(range(len(names)))
     identifier = filename.split('.')[0][-1]
-    return num_wizards, num_constraints, wizards, constraints, identifier
+    return num_wizards, num_constraints, wizards, constraints, identifier, names
+
+def format_output(solution, names=None):
+    if names is not None:
+        solution = [names[wizard] for wizard in solution]
+    return "".join("{0} ".format(wizard) for wizard in solution)
 
-def write_output(filename, solution):
+def write_output(filename, solution, names=None):
     with open(filename, "w") as f:
-        for wizard in solution:
-            f.write("{0} ".format(wizard))
+        f.write(format_output(solution, names))
 
 if __name__=="__main__":
     parser = argparse.ArgumentParser(description = "Constraint Solver.")
     parser.add_argument("input_file", type=str, help = "___.in")
     parser.add_argument("output_file", type=str, help = "___.out")
+    parser.add_argument("--replicas", type=int, default=0,
+                        help = "number of parallel tempering replicas (0 to run a portfolio of anneals)")
+    parser.add_argument("--islands", type=int, default=0,
+                        help = "number of migrating islands (0 to run a portfolio of anneals)")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(),
+                        help = "number of annealer processes in the portfolio")
+    parser.add_argument("--time-limit", type=float, default=None,
+                        help = "seconds after which the best ordering so far is written")
+    parser.add_argument("--cache", type=str, default=None,
+                        help = "directory of a solution cache to reuse solved instances from")
+    parser.add_argument("--init", choices=["greedy"], default=None,
+                        help = "constructive initializer for the portfolio's starting orderings")
+    parser.add_argument("--exact", type=float, default=0,
+                        help = "seconds of exact branch and bound search to try before annealing")
     args = parser.parse_args()
 
-    num_wizards, num_constraints, wizards, constraints, identifier = read_input(args.input_file)
-    solution = solve(num_wizards, num_constraints, wizards, constraints, identifier, args.output_file)
-    write_output(args.output_file, solution)
+    num_wizards, num_constraints, wizards, constraints, identifier, names = read_input(args.input_file)
+    cache = SolutionCache(args.cache) if args.cache else None
+    solution = solve(num_wizards, num_constraints, wizards, constraints, identifier, args.output_file, names,
+                     args.replicas, args.islands, args.workers, args.time_limit, cache=cache, init=args.init,
+                     exact=args.exact)
+    if solution is not None:
+        write_output(args.output_file, solution, names)
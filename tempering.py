@@ -0,0 +1,127 @@
+from __future__ import division
+from __future__ import print_function
+import math
+import multiprocessing
+import os
+import random
+import time
+
+from wizards import worker_annealer
+
+def _replica_worker(conn, num_wizards, num_constraints, wizards, constraints, seed):
+    """
+    Runs one replica in its own process. Each request received on conn is a
+    (temperature, steps) pair; the replica anneals at that temperature and
+    replies with its energy and ordering. A None request stops the worker.
+    """
+    annealer = worker_annealer(seed, num_wizards, num_constraints, wizards, constraints)
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        T, steps = request
+        E, _, _ = annealer.run_at(T, steps)
+        if annealer.solution is not None:
+            conn.send((0, list(annealer.solution)))
+        else:
+            conn.send((E, list(annealer.state)))
+    conn.close()
+
+class ParallelTempering(object):
+    """
+    Parallel Tempering (replica exchange) engine for NonBetweenness.
+
+    Runs one NonBetweenness replica per worker process, each at a fixed
+    temperature of a geometric ladder between Tmin and Tmax. After every
+    round of steps_per_exchange steps, neighbouring temperatures exchange
+    their configurations with the standard acceptance probability
+
+        min(1, exp((1/T_i - 1/T_j) * (E_i - E_j)))
+
+    so that orderings stuck on a plateau at low temperature can be heated
+    up and escape instead of forcing a full restart. Exchanging the
+    temperatures of two replicas is equivalent to exchanging their
+    configurations and avoids shipping orderings between processes.
+    """
+
+    def __init__(self, num_wizards, num_constraints, wizards, constraints,
+                 num_replicas=None, Tmin=0.08, Tmax=2.0, steps_per_exchange=2000):
+        """
+        Input:
+            num_replicas: number of replicas and worker processes, defaults
+                          to the number of cores
+            Tmin, Tmax: coldest and hottest temperatures of the ladder
+            steps_per_exchange: annealing steps run by every replica between
+                                two rounds of exchanges
+        """
+        self.num_wizards = num_wizards
+        self.num_constraints = num_constraints
+        self.wizards = list(wizards)
+        self.constraints = constraints
+        self.num_replicas = max(num_replicas or os.cpu_count() or 1, 2)
+        self.temperatures = [
+            Tmin * (Tmax / Tmin) ** (i / (self.num_replicas - 1))
+            for i in range(self.num_replicas)
+        ]
+        self.steps_per_exchange = steps_per_exchange
+
+    def run(self, time_limit=None, seed=None):
+        """
+        Runs the replicas until one of them reaches zero energy, or until
+        time_limit seconds have passed.
+
+        Output:
+            (state, energy): the best ordering found and its energy
+        """
+        rng = random.Random(seed)
+        connections, workers = [], []
+        for _ in range(self.num_replicas):
+            conn, child_conn = multiprocessing.Pipe()
+            worker = multiprocessing.Process(
+                target=_replica_worker,
+                args=(child_conn, self.num_wizards, self.num_constraints,
+                      self.wizards, self.constraints, rng.getrandbits(64)),
+            )
+            worker.daemon = True
+            worker.start()
+            connections.append(conn)
+            workers.append(worker)
+
+        # replica_at[t] is the replica currently running at temperature t
+        replica_at = list(range(self.num_replicas))
+        best_state, best_energy = None, float("inf")
+        start = time.time()
+        exchange_round = 0
+        try:
+            while best_energy > 0:
+                if time_limit is not None and time.time() - start > time_limit:
+                    break
+                for t, r in enumerate(replica_at):
+                    connections[r].send((self.temperatures[t], self.steps_per_exchange))
+                energies = [None] * self.num_replicas
+                for r, conn in enumerate(connections):
+                    energies[r], state = conn.recv()
+                    if energies[r] < best_energy:
+                        best_state, best_energy = state, energies[r]
+
+                # alternate between exchanging even and odd neighbour pairs
+                for t in range(exchange_round % 2, self.num_replicas - 1, 2):
+                    i, j = replica_at[t], replica_at[t + 1]
+                    delta = (1 / self.temperatures[t] - 1 / self.temperatures[t + 1]) \
+                        * (energies[i] - energies[j])
+                    if delta >= 0 or rng.random() < math.exp(delta):
+                        replica_at[t], replica_at[t + 1] = j, i
+                exchange_round += 1
+                print("Round {0}: best energy {1}, energies by temperature {2}".format(
+                    exchange_round, best_energy, [energies[r] for r in replica_at]))
+        finally:
+            for conn in connections:
+                try:
+                    conn.send(None)
+                except (EOFError, OSError):
+                    pass
+            for worker in workers:
+                worker.join(1)
+                if worker.is_alive():
+                    worker.terminate()
+        return best_state, best_energy
@@ -1,6 +1,40 @@
+import io
+import itertools
+import os
+import random
+import shutil
+import tempfile
 import unittest
 
+from atomic_write import atomic_write
+from buffered_random import BufferedRandom
 from constraint_generator import ConstraintGenerator
+from constraint_matrix import ConstraintMatrix
+from exact_solver import BranchAndBoundSolver
+import generate_input
+from instance_validator import processInput
+from input_generator import DifficultInputGenerator
+from naive_solver import MagicianAgeOrderingSolver
+from result_store import ResultStore
+import solve_all
+from solution_counter import SolutionCounter
+from solution_cache import SolutionCache
+import solver
+from islands import IslandModel
+from tempering import ParallelTempering
+from wizards import NonBetweenness, greedy_ordering
+
+def generated_instance(num_wizards, num_constraints):
+    """Returns the constraints, as wizard ids, of a random instance that
+    the ordering 0..num_wizards-1 satisfies."""
+    cg = ConstraintGenerator(num_wizards, ConstraintGenerator.RANDOM)
+    return [tuple(int(w) for w in c) for c in cg.generate(num_constraints)]
+
+class SolverTestCase(unittest.TestCase):
+    def assertSolves(self, num_wizards, constraints, ordering):
+        self.assertEqual(sorted(ordering), list(range(num_wizards)))
+        matrix = ConstraintMatrix(num_wizards, constraints)
+        self.assertEqual(matrix.count_violated(matrix.positions(ordering)), 0)
 
 class TestConstraintGenerator(unittest.TestCase):
     def setUp(self):
@@ -96,5 +130,631 @@ class TestConstraintGenerator(unittest.TestCase):
                     self.assertFalse(right < wizard < left)
 
 
+class TestStreamingConstraintGenerator(unittest.TestCase):
+    def test_chunks_keep_invariants(self):
+        cg = ConstraintGenerator(10, ConstraintGenerator.RANDOM)
+        chunks = list(cg.generate_chunks(1005, chunk_size=100))
+        self.assertGreater(len(chunks), 1)
+        constraints = [tuple(c) for chunk in chunks for c in chunk.tolist()]
+        self.assertEqual(len(constraints), 1005)
+        for i in range(0, 1000, 10):
+            # each run of n constraints has every wizard as target once
+            self.assertEqual(sorted(c[2] for c in constraints[i:i + 10]), list(range(10)))
+        for first, second, target in constraints:
+            self.assertNotEqual(first, second)
+            # both on the larger side of the target, so 0..n-1 is a solution
+            self.assertTrue(min(first, second) > target or max(first, second) < target)
+            self.assertEqual(first > target, target < 5)
+
+    def test_write_constraints(self):
+        cg = ConstraintGenerator(20, ConstraintGenerator.RANDOM)
+        f = io.StringIO()
+        cg.write_constraints(f, 250, chunk_size=64)
+        lines = f.getvalue().splitlines()
+        self.assertEqual(len(lines), 250)
+        self.assertTrue(all(w in cg.wizards for line in lines for w in line.split()))
+
+
+class TestBufferedRandom(unittest.TestCase):
+    def test_draws_in_range(self):
+        rng = BufferedRandom(0, buffer_size=16)
+        draws = [rng.randint(2, 5) for _ in range(1000)]
+        self.assertEqual(set(draws), {2, 3, 4, 5})
+        self.assertTrue(all(0 <= rng.random() < 1 for _ in range(100)))
+        items = list(range(10))
+        rng.shuffle(items)
+        self.assertEqual(sorted(items), list(range(10)))
+
+    def test_seeded_streams(self):
+        self.assertEqual([BufferedRandom(3).random() for _ in range(2)],
+                         [BufferedRandom(3).random() for _ in range(2)])
+        first, second = BufferedRandom(3).spawn(2)
+        self.assertNotEqual(first.random(), second.random())
+        self.assertEqual(BufferedRandom(3).spawn(2)[1].random(), BufferedRandom(3).spawn(2)[1].random())
+
+
+class TestNonBetweenness(unittest.TestCase):
+    def setUp(self):
+        self.num_wizards = 20
+        self.num_constraints = 60
+        self.constraints = generated_instance(self.num_wizards, self.num_constraints)
+        self.wizards = list(range(self.num_wizards))
+        random.shuffle(self.wizards)
+        self.annealer = NonBetweenness(
+            0, self.num_wizards, self.num_constraints, self.wizards,
+            self.constraints, 'test_out.txt'
+        )
+
+    def _count_violated(self):
+        return sum(
+            1 for c in self.annealer.constraints
+            if self.annealer._is_constraint_violated(c)
+        )
+
+    def test_seeded_anneal_is_reproducible(self):
+        runs = []
+        for _ in range(2):
+            annealer = NonBetweenness(
+                0, self.num_wizards, self.num_constraints, self.wizards,
+                self.constraints, None, rng=BufferedRandom(7))
+            annealer.exit_on_solution = False
+            annealer.run_at(1.0, 300)
+            runs.append(list(annealer.state))
+        self.assertEqual(runs[0], runs[1])
+
+    def test_incremental_violation_count(self):
+        self.assertEqual(self.annealer.num_violated, self._count_violated())
+        for _ in range(500):
+            self.annealer._move_range_shuffle(3)
+            self.annealer._move_randomly()
+            self.assertEqual(self.annealer.num_violated, self._count_violated())
+
+    def test_violated_set_tracks_moves(self):
+        for _ in range(500):
+            self.annealer._move_satisfy_random_constraint()
+            self.annealer._move_range_shuffle(3)
+            expected = set(
+                i for i, c in enumerate(self.annealer.constraints)
+                if self.annealer._is_constraint_violated(c)
+            )
+            self.assertEqual(set(self.annealer.violated), expected)
+            for i, j in enumerate(self.annealer.violated_pos):
+                if j < 0:
+                    self.assertNotIn(i, expected)
+                else:
+                    self.assertEqual(self.annealer.violated[j], i)
+
+    def test_move_returns_energy_delta(self):
+        # don't exit the test run if a move happens to solve the instance
+        self.annealer.exit_on_solution = False
+        for _ in range(200):
+            E = self._count_violated()
+            dE = self.annealer.move()
+            self.assertEqual(dE, self._count_violated() - E)
+
+    def test_batched_move_returns_energy_delta(self):
+        self.annealer.exit_on_solution = False
+        self.annealer.batch_size = 16
+        for _ in range(100):
+            E = self._count_violated()
+            dE = self.annealer.move()
+            self.assertEqual(dE, self._count_violated() - E)
+
+    def test_greedy_ordering(self):
+        ordering = greedy_ordering(self.wizards, self.constraints)
+        self.assertEqual(sorted(ordering), list(range(self.num_wizards)))
+        greedy = NonBetweenness(
+            0, self.num_wizards, self.num_constraints, ordering,
+            self.constraints, 'test_out.txt'
+        )
+        self.assertLessEqual(greedy.num_violated, self.annealer.num_violated)
+
+    def test_anneal_restores_best_state_bookkeeping(self):
+        self.annealer.exit_on_solution = False
+        # hot enough for the final ordering to differ from the best one
+        self.annealer.Tmax, self.annealer.Tmin = 5.0, 4.0
+        self.annealer.steps, self.annealer.updates = 300, 0
+        state, energy = self.annealer.anneal()
+        self.assertEqual(list(self.annealer.state), list(state))
+        self.assertEqual(self.annealer.energy(), energy)
+        self.assertEqual(self._count_violated(), energy)
+        self.assertEqual(self.annealer.dict_check(), 0)
+
+    def test_rollback_restores_violation_count(self):
+        self.annealer.commit()
+        committed_state = list(self.annealer.state)
+        committed_count = self.annealer.num_violated
+        for _ in range(20):
+            self.annealer._move_randomly()
+            self.annealer._move_range_shuffle(3)
+            self.annealer._move_range_mirror(4)
+            self.annealer._move_satisfy_random_constraint()
+        self.annealer.rollback()
+        self.assertEqual(list(self.annealer.state), committed_state)
+        self.assertEqual(self.annealer.num_violated, committed_count)
+        self.assertEqual(self.annealer.num_violated, self._count_violated())
+        self.assertEqual(self.annealer.dict_check(), 0)
+
+
+class TestParallelTempering(SolverTestCase):
+    def test_finds_solution(self):
+        constraints = generated_instance(10, 30)
+        engine = ParallelTempering(
+            10, 30, list(range(10)), constraints, num_replicas=2,
+            steps_per_exchange=500,
+        )
+        state, energy = engine.run(time_limit=60, seed=0)
+        self.assertEqual(energy, 0)
+        self.assertSolves(10, constraints, state)
+
+
+class TestIslandModel(SolverTestCase):
+    def test_finds_solution(self):
+        constraints = generated_instance(10, 30)
+        model = IslandModel(
+            10, 30, list(range(10)), constraints, num_islands=2,
+            migration_interval=500,
+        )
+        state, energy = model.run(time_limit=60, seed=0)
+        self.assertEqual(energy, 0)
+        self.assertSolves(10, constraints, state)
+
+
+class TestSolve(SolverTestCase):
+    def test_portfolio_returns_first_solution(self):
+        constraints = generated_instance(10, 30)
+        portfolio = [{'steps': 2000}, None]
+        state = solver.solve(
+            10, 30, list(range(10)), constraints, 0, None,
+            portfolio=portfolio, time_limit=60, seed=0,
+        )
+        self.assertSolves(10, constraints, state)
+
+    def test_portfolio_stops_when_workers_die(self):
+        constraints = generated_instance(10, 30)
+        # an anneal of 'x' steps raises in every worker
+        state = solver.solve(
+            10, 30, list(range(10)), constraints, 0, None,
+            portfolio=[{'steps': 'x'}] * 2, seed=0,
+        )
+        self.assertEqual(sorted(state), list(range(10)))
+
+
+class TestBranchAndBound(SolverTestCase):
+    def test_solves_generated_instance(self):
+        constraints = generated_instance(20, 300)
+        ordering = BranchAndBoundSolver(20, constraints).solve()
+        self.assertSolves(20, constraints, ordering)
+
+    def test_proves_infeasible(self):
+        # one of any three wizards is between the other two
+        search = BranchAndBoundSolver(3, [(0, 1, 2), (0, 2, 1), (1, 2, 0)])
+        self.assertIsNone(search.solve())
+        self.assertTrue(search.exhausted)
+
+    def test_solve_stops_on_proven_infeasible(self):
+        # without a time limit, annealing would never reach zero energy
+        state = solver.solve(3, 3, [0, 1, 2], [(0, 1, 2), (0, 2, 1), (1, 2, 0)], 0, None,
+                             exact=10)
+        self.assertIsNone(state)
+
+    def test_matches_enumeration(self):
+        rng = random.Random(0)
+        for _ in range(50):
+            constraints = [tuple(rng.sample(range(6), 3)) for _ in range(rng.randint(4, 12))]
+            matrix = ConstraintMatrix(6, constraints)
+            feasible = any(matrix.count_violated(matrix.positions(list(p))) == 0
+                           for p in itertools.permutations(range(6)))
+            ordering = BranchAndBoundSolver(6, constraints).solve()
+            self.assertEqual(ordering is not None, feasible)
+            if ordering is not None:
+                self.assertSolves(6, constraints, ordering)
+
+
+class TestMagicianAgeOrderingSolver(unittest.TestCase):
+    def test_count_matches_all_permutations(self):
+        for n, k in [(5, 3), (6, 5), (7, 8)]:
+            constraints = ConstraintGenerator(n, ConstraintGenerator.RANDOM).generate(k)
+            problem_solver = MagicianAgeOrderingSolver(n)
+            expected = sum(1 for ordering in problem_solver.generate_permutations()
+                           if problem_solver.check_constraints(ordering, constraints))
+            _, solution_count = problem_solver.solve(constraints)
+            self.assertEqual(solution_count, expected)
+
+    def test_valid_orderings_are_streamed(self):
+        problem_solver = MagicianAgeOrderingSolver(12)
+        orderings = problem_solver.generate_valid_orderings([('0', '1', '2')])
+        first = next(orderings)
+        self.assertEqual(sorted(first), sorted(problem_solver.wizard_list))
+        self.assertTrue(problem_solver.check_constraints(first, [('0', '1', '2')]))
+
+    def test_swap_enumeration_count_matches(self):
+        for n, k in [(1, 0), (5, 3), (7, 8)]:
+            constraints = ConstraintGenerator(n, ConstraintGenerator.RANDOM).generate(k) if k else []
+            problem_solver = MagicianAgeOrderingSolver(n)
+            _, expected = problem_solver.solve(constraints)
+            _, solution_count = problem_solver.solve_by_swaps(constraints)
+            self.assertEqual(solution_count, expected)
+
+    def test_sharded_count_matches(self):
+        constraints = ConstraintGenerator(10, ConstraintGenerator.RANDOM).generate(15)
+        _, expected = MagicianAgeOrderingSolver(10).solve(constraints)
+        _, solution_count = MagicianAgeOrderingSolver(10, processes=2).solve(constraints)
+        self.assertEqual(solution_count, expected)
+
+
+class TestSolutionCounter(unittest.TestCase):
+    def test_count_matches_enumeration(self):
+        for n, k in [(6, 5), (8, 10), (9, 20)]:
+            constraints = ConstraintGenerator(n, ConstraintGenerator.RANDOM).generate(k)
+            _, expected = MagicianAgeOrderingSolver(n).solve(constraints)
+            self.assertEqual(SolutionCounter(n, use_numpy=False).count(constraints), expected)
+            self.assertEqual(SolutionCounter(n, use_numpy=True).count(constraints), expected)
+
+    def test_count_past_int64(self):
+        # without constraints every one of the 21! orderings is valid
+        self.assertEqual(SolutionCounter(21).count([]), 51090942171709440000)
+
+    def test_solve_reports_no_time(self):
+        # the time of the whole count says nothing about a first solution
+        self.assertEqual(SolutionCounter(6).solve([('0', '1', '2')]), (0, 480))
+
+
+class TestDifficultInputGenerator(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.input_generator = DifficultInputGenerator(
+            ConstraintGenerator(8, ConstraintGenerator.RANDOM).generate,
+            SolutionCounter(8).solve, 12, ConstraintGenerator.RANDOM,
+            os.path.join(self.tmpdir, 'results.bin'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_parallel_sweep_matches_serial(self):
+        k_list = list(range(1, 13))
+        serial = self.input_generator.run_sweep(8, k_list, 10, seed=1)
+        parallel = self.input_generator.run_sweep(8, k_list, 10, processes=2, seed=1)
+        self.assertEqual(sorted(parallel), k_list)
+        self.assertFalse(serial[1].valid)
+        for k in k_list:
+            self.assertEqual(serial[k].reps, parallel[k].reps)
+            self.assertAlmostEqual(serial[k].avg_solution_count, parallel[k].avg_solution_count)
+            self.assertEqual(serial[k].min_solution_count, parallel[k].min_solution_count)
+
+    def test_parallel_sweep_with_sharded_solver(self):
+        # the sweep's workers can't start the solver's own pool of shards
+        input_generator = DifficultInputGenerator(
+            ConstraintGenerator(9, ConstraintGenerator.RANDOM).generate,
+            MagicianAgeOrderingSolver(9, processes=2).solve, 5, results_file=None)
+        serial = input_generator.run_sweep(9, [5], 2, seed=1)
+        parallel = input_generator.run_sweep(9, [5], 2, processes=2, seed=1)
+        self.assertEqual(parallel[5].reps, 2)
+        self.assertEqual(parallel[5].avg_solution_count, serial[5].avg_solution_count)
+
+    def test_sweep_resumes_from_checkpoint(self):
+        checkpoint = os.path.join(self.tmpdir, 'sweep.json')
+        first = self.input_generator.run_sweep(8, [3, 4], 10, checkpoint=checkpoint)
+        self.input_generator.solve_problem = None  # a resumed k is not run again
+        resumed = self.input_generator.run_sweep(8, [3, 4], 10, checkpoint=checkpoint)
+        self.assertEqual({k: s.to_dict() for k, s in resumed.items()},
+                         {k: s.to_dict() for k, s in first.items()})
+
+    def test_interrupted_sweep_resumes_from_checkpoint(self):
+        checkpoint = os.path.join(self.tmpdir, 'sweep.json')
+        solve_problem = self.input_generator.solve_problem
+        calls = [0]
+
+        def interrupted(constraints):
+            calls[0] += 1
+            if calls[0] > 25:
+                raise KeyboardInterrupt()
+            return solve_problem(constraints)
+
+        # 10 reps of k = 3 and 4 finish before the interruption, k = 5 doesn't
+        self.input_generator.solve_problem = interrupted
+        with self.assertRaises(KeyboardInterrupt):
+            self.input_generator.run_sweep(8, [3, 4, 5], 10, seed=4, checkpoint=checkpoint)
+        _, saved = self.input_generator.load_checkpoint(checkpoint, 8, 10, None, 4)
+        self.assertEqual(sorted(saved), [3, 4])
+
+        self.input_generator.solve_problem = solve_problem
+        resumed = self.input_generator.run_sweep(8, [3, 4, 5], 10, seed=4, checkpoint=checkpoint)
+        self.assertEqual(calls[0], 26)
+        expected = self.input_generator.run_sweep(8, [3, 4, 5], 10, seed=4)
+        self.assertEqual({k: s.to_dict() for k, s in resumed.items()},
+                         {k: s.to_dict() for k, s in expected.items()})
+
+    def test_sweep_records_every_experiment(self):
+        results = self.input_generator.run_sweep(8, [1, 3, 4], 10, seed=2)
+        aggregated = self.input_generator.store.aggregate(8, ConstraintGenerator.RANDOM, 2)
+        self.assertEqual(list(aggregated['k']), [1, 3, 4])
+        self.assertEqual(list(aggregated['reps']), [0, 10, 10])
+        for i, k in enumerate(aggregated['k']):
+            self.assertAlmostEqual(aggregated['avg_solution_count'][i], results[k].avg_solution_count)
+            self.assertEqual(aggregated['min_first_tictoc'][i], results[k].min_first_tictoc)
+            self.assertEqual(aggregated['max_solution_count'][i], results[k].max_solution_count)
+
+    def test_figures_are_written_and_regenerated(self):
+        figures_dir = os.path.join(self.tmpdir, 'figures')
+        self.input_generator.figures_dir = figures_dir
+        self.input_generator.find_best_constraint_to_magicians_ratio(8, reps=5, seed=3)
+        written = sorted(os.listdir(figures_dir))
+        self.assertEqual(len(written), 7)
+        self.assertIn('k_vs_average_solution_count_for_n_8.png', written)
+
+        shutil.rmtree(figures_dir)
+        self.input_generator.plot_stored_results(8)
+        self.input_generator.render_figures()
+        self.assertEqual(sorted(os.listdir(figures_dir)), written)
+
+    def test_adaptive_reps_stop_once_converged(self):
+        # every instance has the same solution count, so the interval of
+        # the average count is empty after the first round
+        input_generator = DifficultInputGenerator(
+            lambda k: [('0', '1', '2')] * k, lambda constraints: (1.0, 4), 50,
+            results_file=None)
+        results = input_generator.run_sweep(5, [3, 4], 1000, tolerance=0.01, min_reps=10)
+        self.assertEqual([results[k].reps for k in [3, 4]], [10, 10])
+        self.assertEqual(results[3].avg_solution_count, 4)
+
+    def test_coarse_to_fine_search_finds_minimum(self):
+        calls = [0]
+
+        def solve_problem(constraints):
+            calls[0] += 1
+            return 1.0, abs(len(constraints) - 37) + 1
+
+        input_generator = DifficultInputGenerator(
+            lambda k: [('0', '1', '2')] * k, solve_problem, 200, results_file=None)
+        results = input_generator.search_k(5, 2, 200, 3, coarse_step=16)
+        self.assertLess(len(results), 60)
+        # no k is swept twice
+        self.assertEqual(calls[0], 3 * len(results))
+        best = min(results, key=lambda k: results[k].avg_solution_count)
+        self.assertEqual(best, 37)
+
+
+class TestResultStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = ResultStore(os.path.join(self.tmpdir, 'results.bin'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_aggregate(self):
+        self.assertEqual(len(self.store.load()), 0)
+        self.store.append([(5, 3, 0, 7, 0, 1.0, 10), (5, 3, 0, 7, 1, 3.0, 20),
+                           (5, 4, 0, 7, 0, None, None), (6, 3, 0, 7, 0, 9.0, 90)])
+        # a repetition appended again, e.g. by a resumed sweep, counts once
+        self.store.append([(5, 3, 0, 7, 1, 3.0, 20)])
+        self.assertEqual(len(self.store.load()), 5)
+        aggregated = self.store.aggregate(5)
+        self.assertEqual(list(aggregated['k']), [3, 4])
+        self.assertEqual(list(aggregated['reps']), [2, 0])
+        self.assertEqual(list(aggregated['avg_solution_count']), [15, 0])
+        self.assertEqual(list(aggregated['max_first_tictoc']), [3, 0])
+        self.assertEqual(list(aggregated['min_first_tictoc']), [1, float('inf')])
+
+    def test_ignores_truncated_record(self):
+        self.store.append([(5, 3, 0, 7, 0, 1.0, 10)])
+        with open(self.store.filename, 'ab') as f:
+            f.write(b'\0' * 5)
+        self.assertEqual(len(self.store.load()), 1)
+
+    def test_append_after_truncated_record(self):
+        self.store.append([(5, 3, 0, 7, 0, 1.0, 10)])
+        with open(self.store.filename, 'ab') as f:
+            f.write(b'\0' * 5)
+        self.store.append([(5, 4, 0, 7, 1, 2.0, 20)])
+        records = self.store.load()
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[1].tolist(), (5, 4, 0, 7, 1, 2.0, 20.0))
+
+
+class TestGenerateInput(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_generates_valid_instances(self):
+        filenames = generate_input.generate_inputs(self.tmpdir, [20, 35], 2, 2, seed=0)
+        self.assertEqual(len(filenames), 4)
+        for filename in filenames:
+            n = int(os.path.basename(filename)[len('input'):].split('_')[0])
+            self.assertEqual(processInput(filename, n), "Success!")
+        self.assertEqual(sorted(os.listdir(os.path.join(self.tmpdir, 'inputs20'))),
+                         ['input20_0.in', 'input20_1.in'])
+
+    def test_seeded_instances_are_reproducible(self):
+        self.assertEqual(generate_input.format_instance(20, 49, 5),
+                         generate_input.format_instance(20, 49, 5))
+
+
+class TestAtomicWrite(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'output.out')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_replaces_file(self):
+        with atomic_write(self.filename) as f:
+            f.write('old')
+        with atomic_write(self.filename) as f:
+            f.write('new')
+        with open(self.filename) as f:
+            self.assertEqual(f.read(), 'new')
+        self.assertEqual(os.listdir(self.tmpdir), ['output.out'])
+
+    def test_failed_write_keeps_old_file(self):
+        with atomic_write(self.filename) as f:
+            f.write('old')
+        with self.assertRaises(ValueError):
+            with atomic_write(self.filename) as f:
+                f.write('new')
+                raise ValueError()
+        with open(self.filename) as f:
+            self.assertEqual(f.read(), 'old')
+        self.assertEqual(os.listdir(self.tmpdir), ['output.out'])
+
+
+class TestSolveAll(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_solves_directory(self):
+        input_dir = os.path.join(self.tmpdir, 'inputs')
+        output_dir = os.path.join(self.tmpdir, 'outputs')
+        os.makedirs(input_dir)
+        shutil.copy('phase2_inputs/inputs20/input20_0.in', input_dir)
+        rows = solve_all.solve_all(input_dir, output_dir, 1, 60, 0)
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['status'], 'solved')
+        self.assertEqual(os.listdir(output_dir), ['input20_0.in'])
+        # a rerun skips instances that already have a valid output
+        self.assertEqual(solve_all.solve_all(input_dir, output_dir, 1, 60, 0), [])
+
+    def test_rerun_retries_unsolved(self):
+        input_dir = os.path.join(self.tmpdir, 'inputs')
+        output_dir = os.path.join(self.tmpdir, 'outputs')
+        os.makedirs(input_dir)
+        os.makedirs(output_dir)
+        shutil.copy('phase2_inputs/inputs20/input20_0.in', input_dir)
+        _, _, wizards, constraints, _, names = solver.read_input('phase2_inputs/inputs20/input20_0.in')
+        # the wizards in order of first mention violate some constraint
+        self.assertIsNone(solver.valid_state(names, names, constraints))
+        solver.write_output(os.path.join(output_dir, 'input20_0.in'), wizards, names)
+        rows = solve_all.solve_all(input_dir, output_dir, 1, 60, 0)
+        self.assertEqual([row['status'] for row in rows], ['solved'])
+
+    def test_report_merges_earlier_rows(self):
+        report = os.path.join(self.tmpdir, 'summary.csv')
+        solve_all.write_report(report, [
+            {'input': 'a.in', 'status': 'solved', 'attempts': 1, 'seconds': 1.0, 'energy': 0},
+            {'input': 'b.in', 'status': 'unsolved', 'attempts': 3, 'seconds': 9.0, 'energy': 2},
+        ])
+        rows = solve_all.merge_report(report, [
+            {'input': 'b.in', 'status': 'solved', 'attempts': 1, 'seconds': 2.0, 'energy': 0},
+        ])
+        self.assertEqual([(row['input'], row['status']) for row in rows],
+                         [('a.in', 'solved'), ('b.in', 'solved')])
+
+
+class TestSolutionCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_key_is_canonical(self):
+        constraints = [['A', 'B', 'C'], ['D', 'C', 'A']]
+        reordered = [['C', 'D', 'A'], ['A', 'B', 'C'], ['B', 'A', 'C']]
+        self.assertEqual(SolutionCache.key(constraints), SolutionCache.key(reordered))
+        self.assertNotEqual(
+            SolutionCache.key(constraints), SolutionCache.key([['A', 'C', 'B']])
+        )
+
+    def test_put_get_and_evict(self):
+        cache = SolutionCache(self.tmpdir, max_bytes=9)
+        cache.put([['A', 'B', 'C']], ['A', 'B', 'C'])
+        self.assertEqual(cache.get([['B', 'A', 'C']]), ['A', 'B', 'C'])
+        self.assertEqual(SolutionCache(self.tmpdir).get([['A', 'B', 'C']]), ['A', 'B', 'C'])
+        # 5 bytes each: the least recently used entry goes
+        cache.put([['D', 'E', 'F']], ['D', 'E', 'F'])
+        self.assertIsNone(cache.get([['A', 'B', 'C']]))
+        self.assertEqual(cache.get([['D', 'E', 'F']]), ['D', 'E', 'F'])
+
+    def test_shared_by_several_caches(self):
+        # e.g. the workers of solve_all -j N --cache
+        first = SolutionCache(self.tmpdir, max_bytes=12)
+        first.put([['A', 'B', 'C']], ['A', 'B', 'C'])
+        second = SolutionCache(self.tmpdir, max_bytes=12)
+        first.put([['D', 'E', 'F']], ['D', 'E', 'F'])
+        self.assertEqual(second.get([['A', 'B', 'C']]), ['A', 'B', 'C'])
+        self.assertEqual(second.get([['D', 'E', 'F']]), ['D', 'E', 'F'])
+        # both entries count toward max_bytes, and A B C was used least recently
+        second.get([['D', 'E', 'F']])
+        second.put([['G', 'H', 'I']], ['G', 'H', 'I'])
+        self.assertIsNone(first.get([['A', 'B', 'C']]))
+        self.assertEqual(first.get([['D', 'E', 'F']]), ['D', 'E', 'F'])
+        self.assertEqual(first.get([['G', 'H', 'I']]), ['G', 'H', 'I'])
+
+    def test_solve_uses_valid_cached_solution(self):
+        cache = SolutionCache(self.tmpdir)
+        names = ['A', 'B', 'C']
+        # C is not between A and B
+        cache.put([['A', 'B', 'C']], ['C', 'A', 'B'])
+        state = solver.solve(3, 1, [0, 1, 2], [(0, 1, 2)], 0, None, names,
+                             time_limit=0, cache=cache)
+        self.assertEqual(state, [2, 0, 1])
+
+
+class TestSolverIO(unittest.TestCase):
+    def test_read_input_interns_names(self):
+        num_wizards, num_constraints, wizards, constraints, _, names = \
+            solver.read_input('phase2_inputs/inputs20/input20_0.in')
+        self.assertEqual(len(wizards), num_wizards)
+        self.assertEqual(len(constraints), num_constraints)
+        self.assertEqual(sorted(wizards), list(range(len(names))))
+        with open('phase2_inputs/inputs20/input20_0.in') as f:
+            f.readline(), f.readline()
+            first = tuple(f.readline().split())
+        self.assertEqual(tuple(names[w] for w in constraints[0]), first)
+
+
+class TestConstraintMatrix(unittest.TestCase):
+    def setUp(self):
+        self.wizards = list(range(12))
+        self.constraints = generated_instance(12, 40)
+        self.matrix = ConstraintMatrix(12, self.constraints)
+
+    def _violated(self, ordering):
+        pos = {w: i for i, w in enumerate(ordering)}
+        return [
+            pos[a] < pos[c] < pos[b] or pos[b] < pos[c] < pos[a]
+            for a, b, c in self.constraints
+        ]
+
+    def test_known_solution_has_no_violations(self):
+        positions = self.matrix.positions(self.wizards)
+        self.assertEqual(self.matrix.count_violated(positions), 0)
+
+    def test_matches_python_check(self):
+        orderings = []
+        for _ in range(10):
+            ordering = list(self.wizards)
+            random.shuffle(ordering)
+            orderings.append(ordering)
+        stack = self.matrix.positions(orderings)
+        masks = self.matrix.violated_mask(stack)
+        counts = self.matrix.count_violated(stack)
+        for ordering, mask, count in zip(orderings, masks, counts):
+            self.assertEqual(mask.tolist(), self._violated(ordering))
+            self.assertEqual(count, sum(self._violated(ordering)))
+
+    def test_swap_deltas_match_applied_swaps(self):
+        ordering = list(self.wizards)
+        random.shuffle(ordering)
+        positions = self.matrix.positions(ordering)
+        first = [random.randint(0, 11) for _ in range(50)]
+        second = [random.randint(0, 11) for _ in range(50)]
+        deltas = self.matrix.swap_deltas(positions, first, second)
+        E = sum(self._violated(ordering))
+        for u, v, delta in zip(first, second, deltas):
+            swapped = list(ordering)
+            i, j = swapped.index(u), swapped.index(v)
+            swapped[i], swapped[j] = swapped[j], swapped[i]
+            self.assertEqual(delta, sum(self._violated(swapped)) - E)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -9,30 +9,120 @@ from random import (
 import random
 import os
 import sys
+from array import array
+
+import numpy as np
 dir_path = os.path.dirname(os.path.realpath(__file__))
 sys.path.insert(0, dir_path + '/simanneal-master/simanneal')
 from anneal import Annealer
+from buffered_random import BufferedRandom
+from constraint_matrix import ConstraintMatrix
+
+def greedy_ordering(wizards, constraints):
+    """
+    Builds a starting ordering by inserting the wizards one by one, those
+    mentioned by the most constraints first, each at the position violating
+    the fewest constraints among those whose wizards are all placed already
+    (ties are broken at random).
+
+    Inserting a wizard never changes the relative order of the ones already
+    placed, so only the constraints mentioning the new wizard need to be
+    checked at each candidate position.
+    """
+    wiz_to_constraints = {w : [] for w in wizards}
+    for c in constraints:
+        for w in set(c):
+            wiz_to_constraints[w].append(c)
+    order = sorted(wizards, key=lambda w: (-len(wiz_to_constraints[w]), random.random()))
+
+    ordering = []
+    placed = set()
+    for w in order:
+        decided = [c for c in wiz_to_constraints[w] if placed.issuperset(x for x in c if x != w)]
+        pos = {x : i for i, x in enumerate(ordering)}
+        best_slots, best_violations = [], None
+        for slot in range(len(ordering) + 1):
+            # w sits just before the wizard currently at index slot
+            pos[w] = slot - 0.5
+            violations = sum(
+                1 for a, b, c in decided
+                if pos[a] < pos[c] < pos[b] or pos[b] < pos[c] < pos[a]
+            )
+            if best_violations is None or violations < best_violations:
+                best_slots, best_violations = [slot], violations
+            elif violations == best_violations:
+                best_slots.append(slot)
+        ordering.insert(choice(best_slots), w)
+        placed.add(w)
+    return ordering
+
+def worker_annealer(seed, num_wizards, num_constraints, wizards, constraints, shuffled=True):
+    """
+    Returns a NonBetweenness annealer for a worker process of a parallel
+    solver, which keeps annealing past a solution (see exit_on_solution)
+    instead of writing it out and exiting. Seeds the random and np.random
+    generators of the process, and so the annealer's, unless seed is None,
+    then starts from a shuffled copy of wizards unless shuffled is False.
+    """
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed % 2**32)
+    wizards = list(wizards)
+    if shuffled:
+        random.shuffle(wizards)
+    annealer = NonBetweenness(None, num_wizards, num_constraints, wizards, constraints, None)
+    annealer.exit_on_solution = False
+    return annealer
 
 class NonBetweenness(Annealer):
-    def __init__(self, identifier, num_wizards, num_constraints, wizards, constraints, outfile):
-        # NOTE: state == wizards
+    # the state is an array of ints, so slicing copies it
+    copy_strategy = 'slice'
+
+    def __init__(self, identifier, num_wizards, num_constraints, wizards, constraints, outfile, names=None,
+                 rng=None):
+        # NOTE: state == wizards, as an array of wizard ids (see solver.read_input)
         # shuffle(wizards) # do not shuffle because we may start with an ordering
-        super(NonBetweenness, self).__init__(wizards)
+        super(NonBetweenness, self).__init__(array('H', wizards))
         # set hyperparameters
         self.Tmax = 2.0
         self.Tmin = 0.08
         self.steps = 100000
         self.updates = 1500
+        # when > 0, each move scores this many candidate swaps at once and
+        # performs the best of them (see _move_batch_swaps)
+        self.batch_size = 0
         # self.randomize_hyperparams() # use this for exploring
+        # random numbers of the moves and of the acceptance test; seeded
+        # from the random module by default, so random.seed still replays
+        self.rng = rng if rng is not None else BufferedRandom(random.getrandbits(64))
 
-        # mapping for efficient position lookup by wizard name
+        # mapping for efficient position lookup by wizard id
         self.identifier = identifier
-        self.wiz_to_pos = {wizards[i] : i for i in range(len(wizards))}
+        self.wiz_to_pos = array('H', bytes(2 * len(wizards)))
+        for i, w in enumerate(self.state):
+            self.wiz_to_pos[w] = i
         self.num_wizards = num_wizards
         self.num_constraints = num_constraints
         self.constraints = constraints
         self.wizards = wizards
         self.outfile = outfile
+        self.names = names
+        # when False, finding a solution stores it in self.solution and stops
+        # the current anneal instead of saving it and exiting the process
+        self.exit_on_solution = True
+        self.solution = None
+
+        # index of the constraints mentioning each wizard, so that a move only
+        # has to re-check the constraints of the wizards it displaced
+        self.wiz_to_constraints = [[] for _ in wizards]
+        for i, c in enumerate(constraints):
+            for w in set(c):
+                self.wiz_to_constraints[w].append(i)
+        self.constraint_matrix = ConstraintMatrix(len(wizards), constraints)
+        self._recompute_violations()
+
+        # (wizard, previous position) for every placement since the last commit
+        self.undo_log = []
 
     def randomize_hyperparams(self):
         self.Tmax = random.uniform(2.5, 5)
@@ -40,45 +130,87 @@ class NonBetweenness(Annealer):
         self.steps = randint(20000, 200000)
         self.updates = 100
 
+    @property
+    def num_violated(self):
+        return len(self.violated)
+
     def energy(self):
-        """Calculates the number of constraints unsatisfied."""
-        E = sum([1 for c in self.constraints if self._is_constraint_violated(c)])
+        """Returns the number of constraints unsatisfied, as maintained by the moves."""
+        E = self.num_violated
         if E == 0:
-            self._save_solution()
-            print("exiting...")
-            exit()
+            self._found_solution()
         return E
 
     def move(self):
-        """Performs a move during the simmulated annealing algorithm."""
-        self._move_range_shuffle(3)
-        self._move_satisfy_random_constraint()
+        """Performs a move during the simmulated annealing algorithm and
+        returns the change in energy, so the annealer can skip energy()."""
+        E = self.num_violated
+        if self.batch_size > 0:
+            self._move_batch_swaps(self.batch_size)
+        else:
+            self._move_range_shuffle(3)
+            self._move_satisfy_random_constraint()
         # self._move_range_shuffle(3)
         #if (curr_energy > 50):
         #    self._move_satisfy_random_constraint()
         #else:
         #    self._move_range_shuffle(3)
+        if self.num_violated == 0:
+            self._found_solution()
+        return self.num_violated - E
+
+    def set_state(self, wizards):
+        """Replaces the current ordering, e.g. with one found by another
+        annealer or with the best one at the end of anneal()."""
+        self.state = array('H', wizards)
+        for i, w in enumerate(self.state):
+            self.wiz_to_pos[w] = i
+        self._recompute_violations()
+        del self.undo_log[:]
+
+    def commit(self):
+        """Accepts the moves made since the last commit by forgetting how to undo them."""
+        del self.undo_log[:]
+
+    def rollback(self):
+        """Undoes the moves made since the last commit by replaying the undo
+        log in reverse, then re-checks the constraints of the moved wizards."""
+        moved = []
+        for wizard, pos in reversed(self.undo_log):
+            self.state[pos] = wizard
+            self.wiz_to_pos[wizard] = pos
+            moved.append(wizard)
+        del self.undo_log[:]
+        self._update_violations(moved)
 
     def print_violated_constraints(self):
-        for c in self.constraints:
-            if self._is_constraint_violated(c):
-                print(c)
+        for i in self.violated:
+            print(self.constraints[i])
+
+    def _found_solution(self):
+        if not self.exit_on_solution:
+            self.solution = self.state[:]
+            self.user_exit = True
+            return
+        self._save_solution()
+        print("exiting...")
+        exit()
 
     def _save_solution(self):
+        # imported here since solver imports this module
+        from solver import write_output
         print("FOUND OPTIMAL:", self.state)
         print("saving to file...", self.outfile)
-        with open(self.outfile, 'w') as file:
-            for w in self.state:
-                file.write("{0} ".format(w))
+        write_output(self.outfile, self.state, self.names)
 
     def _move_adjacently(self):
-        a = randint(0, len(self.state) - 1)
+        a = self.rng.randint(0, len(self.state) - 1)
         if a == 0:
             b = a + 1
         elif a == len(self.state) - 1:
             b = a - 1
         else:
-            offset = choice([1, -1])
+            offset = self.rng.choice([1, -1])
             b = a + offset
         self._swap_wizards(self.state[a], self.state[b])
 
@@ -93,7 +225,7 @@ class NonBetweenness(Annealer):
 
     def _move_range_shuffle(self, range_len):
         """Shuffles a random, continuous subset of the current state, provided the length of the range desired to be shuffled"""
-        start = randint(0, len(self.state) - range_len)
+        start = self.rng.randint(0, len(self.state) - range_len)
         end = start + range_len
 
         # print("start: " + str(start))
@@ -107,12 +239,14 @@ class NonBetweenness(Annealer):
         #for wizard in copy_state:
         #    print(wizard)
 
-        random.shuffle(copy_state)
+        self.rng.shuffle(copy_state)
 
         for i, wizard in enumerate(copy_state):
             #print("wiz1_loop: " + wizard)
+            self.undo_log.append((wizard, self.wiz_to_pos[wizard]))
             self.state[start + i] = wizard
             self.wiz_to_pos[wizard] = start + i
+        self._update_violations(copy_state)
 
         # print("post state: ", self.state)
         # print("post dict: ", self.wiz_to_pos)
@@ -124,42 +258,88 @@ class NonBetweenness(Annealer):
     def _move_range_mirror(self, range_len):
         """Shuffles a random, continuous subset of the current state, provided the length of the range desired to be shuffled"""
         #start1 = randint(range_len, len(self.state) - range_len)
-        start = randint(0, len(self.state) - range_len)
+        start = self.rng.randint(0, len(self.state) - range_len)
         #range_list = choice([[start1, start1 - range_len], [start2, start2 + range_len]])
         end = start + range_len
 
         copy_state = self.state[start:end]
+        for i, wizard in enumerate(copy_state):
+            self.undo_log.append((wizard, start + i))
         copy_state.reverse()
         self.state[start:end] = copy_state
 
         for wizard in self.state[start:end]:
             self.wiz_to_pos[wizard] = self.state.index(wizard)
+        self._update_violations(copy_state)
 
     def _move_satisfy_random_constraint(self):
         """Satisfies a random unsatisfied constraint."""
-        secure_random = random.SystemRandom()
-        done = False
-        while not done:
-            c = secure_random.choice(self.constraints)
-            if self._is_constraint_violated(c):
-                done = True
-                # swap 2 wizards to move closer
-                self._swap_wizards(c[random.randint(0, 1)], c[2])
-                # with probability 0.5, swap the two border wizards
-                if random.randint(0, 1) == 1:
-                    self._swap_wizards(c[0], c[1])
-        if not done: print("Nothing to do...")
+        if not self.violated:
+            print("Nothing to do...")
+            return
+        c = self.constraints[self.rng.choice(self.violated)]
+        # swap 2 wizards to move closer
+        self._swap_wizards(c[self.rng.randint(0, 1)], c[2])
+        # with probability 0.5, swap the two border wizards
+        if self.rng.randint(0, 1) == 1:
+            self._swap_wizards(c[0], c[1])
+
+    def _move_batch_swaps(self, batch_size):
+        """Scores batch_size random swaps together and performs the best one
+        (a tournament); the annealer then accepts or rejects it as usual."""
+        first = self.rng.integers(len(self.state), batch_size)
+        second = self.rng.integers(len(self.state), batch_size)
+        deltas = self.constraint_matrix.swap_deltas(self.wiz_to_pos, first, second)
+        best = np.flatnonzero(deltas == deltas.min())
+        i = best[self.rng.randint(0, len(best) - 1)]
+        self._swap_wizards(int(first[i]), int(second[i]))
 
     def _move_randomly(self):
         """Swaps two wizard assignments."""
-        a, b = randint(0, len(self.state) - 1), randint(0, len(self.state) - 1)
+        a, b = self.rng.randint(0, len(self.state) - 1), self.rng.randint(0, len(self.state) - 1)
         wiz1, wiz2 = self.state[a], self.state[b]
         self._swap_wizards(wiz1, wiz2)
 
     def _swap_wizards(self, wiz1, wiz2):
         pos1, pos2 = self.wiz_to_pos[wiz1], self.wiz_to_pos[wiz2]
+        self.undo_log.append((wiz1, pos1))
+        self.undo_log.append((wiz2, pos2))
         self.state[pos1], self.state[pos2] = self.state[pos2], self.state[pos1]
         self.wiz_to_pos[wiz1], self.wiz_to_pos[wiz2] = self.wiz_to_pos[wiz2], self.wiz_to_pos[wiz1]
+        self._update_violations((wiz1, wiz2))
+
+    def _recompute_violations(self):
+        """Re-checks every constraint at once against the current ordering.
+
+        The violated constraints are kept as an indexable set: self.violated
+        lists their indices in no particular order, and self.violated_pos[i]
+        is the index of constraint i in that list, or -1 if it is satisfied.
+        """
+        mask = self.constraint_matrix.violated_mask(self.wiz_to_pos)
+        self.violated = mask.nonzero()[0].tolist()
+        self.violated_pos = [-1] * len(self.constraints)
+        for j, i in enumerate(self.violated):
+            self.violated_pos[i] = j
+
+    def _update_violations(self, wizards):
+        """Re-checks the constraints mentioning the given (moved) wizards and
+        keeps the set of violated constraints up to date."""
+        affected = set()
+        for w in wizards:
+            affected.update(self.wiz_to_constraints[w])
+        for i in affected:
+            violated = self._is_constraint_violated(self.constraints[i])
+            j = self.violated_pos[i]
+            if violated and j < 0:
+                self.violated_pos[i] = len(self.violated)
+                self.violated.append(i)
+            elif not violated and j >= 0:
+                # swap-remove: move the last entry into the freed slot
+                last = self.violated.pop()
+                if last != i:
+                    self.violated[j] = last
+                    self.violated_pos[last] = j
+                self.violated_pos[i] = -1
 
     def _is_constraint_violated(self, c):
         return (